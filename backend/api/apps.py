@@ -0,0 +1,44 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+
+class ApiConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'api'
+
+    def ready(self):
+        from ingredients.models import Ingredient
+        from recipes.models import (
+            Recipe, RecipeIngredient, ShortLink, recipes_updated
+        )
+        from tags.models import Tag
+        from users.models import User
+        from . import response_cache
+        from .catalog import ingredient_catalog, tag_catalog
+        from .metrics import install_query_recorder
+        from .short_links import short_link_deleted
+
+        connection_created.connect(install_query_recorder)
+
+        for sender, catalog in (
+            (Tag, tag_catalog),
+            (Ingredient, ingredient_catalog),
+        ):
+            post_save.connect(
+                catalog.invalidate, sender=sender, weak=False)
+            post_delete.connect(
+                catalog.invalidate, sender=sender, weak=False)
+
+        post_save.connect(response_cache.recipe_changed, sender=Recipe)
+        post_delete.connect(response_cache.recipe_changed, sender=Recipe)
+        post_save.connect(
+            response_cache.recipe_ingredient_changed, sender=RecipeIngredient)
+        post_delete.connect(
+            response_cache.recipe_ingredient_changed, sender=RecipeIngredient)
+        m2m_changed.connect(
+            response_cache.recipe_tags_changed, sender=Recipe.tags.through)
+        post_save.connect(response_cache.author_changed, sender=User)
+        recipes_updated.connect(
+            response_cache.recipes_updated, sender=Recipe)
+        post_delete.connect(short_link_deleted, sender=ShortLink)
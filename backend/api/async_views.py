@@ -0,0 +1,52 @@
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
+from django.utils.functional import classproperty
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView с асинхронной диспетчеризацией.
+    Асинхронные обработчики выполняются в цикле событий, а синхронные
+    (например, запись) и проверки аутентификации и прав, которые ходят
+    в БД, запускаются в отдельном потоке через sync_to_async.
+    """
+
+    @classproperty
+    def view_is_async(cls):
+        return True
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # csrf_exempt из APIView.as_view теряет пометку корутины.
+        markcoroutinefunction(view)
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(),
+                                  self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if not iscoroutinefunction(handler):
+                handler = sync_to_async(handler)
+            response = await handler(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs)
+        return self.response
@@ -0,0 +1,290 @@
+import base64
+import io
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from ingredients.models import Ingredient
+from recipes.models import Recipe
+from recipes.synthetic import USERNAME_PREFIX
+from tags.models import Tag
+from users.models import User
+
+
+def make_image():
+    """Небольшое изображение в формате data URI для создания рецептов."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), (230, 120, 40)).save(buffer, "JPEG")
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f"data:image/jpeg;base64,{encoded}"
+
+
+class Context:
+    """Данные, из которых сценарии собирают запросы."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.users = list(User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).values_list("id", flat=True)[:200])
+        if not self.users:
+            raise ValueError(
+                "No synthetic users found, generate a dataset first.")
+        self.tokens = {
+            user_id: Token.objects.get_or_create(user_id=user_id)[0].key
+            for user_id in self.users
+        }
+        self.recipes = list(Recipe.objects.order_by("?").values_list(
+            "id", flat=True)[:1000])
+        self.tags = list(Tag.objects.values_list("id", "slug"))
+        self.ingredients = list(Ingredient.objects.values_list("id", "name"))
+        self.image = make_image()
+
+    def choice(self, items):
+        with self.lock:
+            return self.rng.choice(items)
+
+    def randint(self, low, high):
+        with self.lock:
+            return self.rng.randint(low, high)
+
+    def client(self, user_id=None):
+        client = APIClient()
+        if user_id is not None:
+            client.credentials(
+                HTTP_AUTHORIZATION=f"Token {self.tokens[user_id]}")
+        return client
+
+    def recipe_payload(self):
+        return {
+            "name": "Бенчмарк",
+            "text": "Рецепт, созданный нагрузочным тестом.",
+            "cooking_time": self.randint(1, 120),
+            "image": self.image,
+            "tags": [self.choice(self.tags)[0]],
+            "ingredients": [
+                {"id": ingredient_id, "amount": self.randint(1, 500)}
+                for ingredient_id, _ in {
+                    self.choice(self.ingredients) for _ in range(8)}
+            ],
+        }
+
+
+def browse_feed(ctx, request):
+    """
+    Просмотр ленты с фильтрами, подбор по ингредиентам, карточка рецепта
+    с похожими рецептами и короткая ссылка.
+    """
+    client = ctx.client(ctx.choice(ctx.users))
+    anonymous = ctx.client()
+    page = ctx.randint(1, 5)
+    request("recipe-list", anonymous.get,
+            f"/api/recipes/?page={page}&limit=6")
+    request("recipe-list", client.get,
+            f"/api/recipes/?limit=6&tags={ctx.choice(ctx.tags)[1]}")
+    request("recipe-list", client.get,
+            f"/api/recipes/?limit=6&author={ctx.choice(ctx.users)}")
+    request("recipe-list", client.get, "/api/recipes/?limit=6&is_favorited=1")
+    request("recipe-list", client.get,
+            "/api/recipes/?limit=6&is_in_shopping_cart=1")
+    request("recipe-list", client.get,
+            "/api/recipes/?limit=6&ordering=-favorites_count")
+    request("recipe-list", anonymous.get,
+            "/api/recipes/?limit=6&ordering=trending")
+    pantry = [ctx.choice(ctx.ingredients)[0] for _ in range(10)]
+    request("recipe-match", anonymous.get, "/api/recipes/match/",
+            {"ingredients": pantry, "min_coverage": 0.3, "limit": 6})
+    recipe_id = ctx.choice(ctx.recipes)
+    request("recipe-detail", client.get, f"/api/recipes/{recipe_id}/")
+    request("recipe-similar", anonymous.get,
+            f"/api/recipes/{recipe_id}/similar/")
+    response = request("recipe-short-link", anonymous.get,
+                       f"/api/recipes/{recipe_id}/get-link/")
+    if response.status_code == 200:
+        request("short-link", anonymous.get,
+                urlparse(response.json()["short-link"]).path)
+
+
+def autocomplete(ctx, request):
+    """Набор названия ингредиента по буквам в форме рецепта."""
+    client = ctx.client(ctx.choice(ctx.users))
+    ingredient_id, name = ctx.choice(ctx.ingredients)
+    for length in range(1, min(len(name), 5) + 1):
+        request("ingredient-list", client.get,
+                "/api/ingredients/", {"name": name[:length]})
+    request("ingredient-detail", client.get,
+            f"/api/ingredients/{ingredient_id}/")
+    request("tag-list", client.get, "/api/tags/")
+    request("tag-detail", client.get, f"/api/tags/{ctx.choice(ctx.tags)[0]}/")
+
+
+def write_recipe(ctx, request):
+    """Создание, изменение и удаление рецепта."""
+    client = ctx.client(ctx.choice(ctx.users))
+    response = request("recipe-list", client.post, "/api/recipes/",
+                       ctx.recipe_payload(), format="json")
+    if response.status_code != 201:
+        return
+    recipe_id = response.json()["id"]
+    payload = ctx.recipe_payload()
+    del payload["image"]
+    request("recipe-detail", client.patch, f"/api/recipes/{recipe_id}/",
+            payload, format="json")
+    request("recipe-detail", client.delete, f"/api/recipes/{recipe_id}/")
+
+
+def shopping(ctx, request):
+    """Избранное, список покупок и его скачивание."""
+    client = ctx.client(ctx.choice(ctx.users))
+    recipe_id = ctx.choice(ctx.recipes)
+    request("add-recipe-to-favorites", client.post,
+            f"/api/recipes/{recipe_id}/favorite/")
+    request("add-recipe-to-favorites", client.delete,
+            f"/api/recipes/{recipe_id}/favorite/")
+    request("add-recipe-to-shopping-list", client.post,
+            f"/api/recipes/{recipe_id}/shopping_cart/")
+    request("download-shopping-list", client.get,
+            "/api/recipes/download_shopping_cart/")
+    request("add-recipe-to-shopping-list", client.delete,
+            f"/api/recipes/{recipe_id}/shopping_cart/")
+    week = {"recipes": [ctx.choice(ctx.recipes) for _ in range(7)]}
+    request("bulk-shopping-list", client.post,
+            "/api/recipes/shopping_cart/", week, format="json")
+    request("bulk-shopping-list", client.delete,
+            "/api/recipes/shopping_cart/", week, format="json")
+
+
+def subscriptions(ctx, request):
+    """Подписки и профили пользователей."""
+    user_id = ctx.choice(ctx.users)
+    client = ctx.client(user_id)
+    author_id = ctx.choice(ctx.users)
+    request("my_subscriptions", client.get,
+            "/api/users/subscriptions/?limit=6&recipes_limit=3")
+    request("recipe-followed-feed", client.get, "/api/recipes/feed/?limit=6")
+    request("subscribe", client.post, f"/api/users/{author_id}/subscribe/")
+    request("subscribe", client.delete, f"/api/users/{author_id}/subscribe/")
+    request("user-list", client.get, "/api/users/?limit=6")
+    request("user-profile", client.get, f"/api/users/{author_id}/")
+    request("current-user", client.get, "/api/users/me/")
+
+
+SCENARIOS = {
+    "feed": browse_feed,
+    "autocomplete": autocomplete,
+    "write": write_recipe,
+    "shopping": shopping,
+    "subscriptions": subscriptions,
+}
+
+
+class Recorder:
+    """
+    Собираем время ответа и число SQL-запросов по эндпоинтам.
+    После каждого запроса закрываем устаревшие соединения с БД, как это
+    делает Django по сигналу request_finished, поэтому время установки
+    соединения при CONN_MAX_AGE = 0 попадает в замеры.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.connections = 0
+
+    def __call__(self, name, method, *args, **kwargs):
+        label = f"{method.__name__.upper()} {name}"
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = method(*args, **kwargs)
+            if getattr(response, "streaming", False):
+                b"".join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+        close_old_connections()
+        with self.lock:
+            self.samples[label].append((elapsed, len(queries)))
+            if response.status_code >= 400:
+                self.errors[label] += 1
+        return response
+
+    def connection_created(self, sender, connection, **kwargs):
+        with self.lock:
+            self.connections += 1
+
+
+def percentile(values, percent):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100)[percent - 1]
+
+
+def run(scenarios, iterations, concurrency=1, seed=0, conn_max_age=None):
+    """
+    Прогоняем сценарии и возвращаем статистику по эндпоинтам.
+    conn_max_age на время прогона заменяет CONN_MAX_AGE из настроек.
+    """
+    ctx = Context(seed)
+    recorder = Recorder()
+    database = connection.settings_dict
+    default_max_age = database["CONN_MAX_AGE"]
+    if conn_max_age is not None:
+        connection.close()
+        database["CONN_MAX_AGE"] = conn_max_age
+    connection_created.connect(recorder.connection_created)
+
+    def worker(index):
+        try:
+            for _ in range(iterations):
+                for name in scenarios:
+                    SCENARIOS[name](ctx, recorder)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    try:
+        if concurrency == 1:
+            for _ in range(iterations):
+                for name in scenarios:
+                    SCENARIOS[name](ctx, recorder)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(worker, range(concurrency)))
+    finally:
+        connection_created.disconnect(recorder.connection_created)
+        database["CONN_MAX_AGE"] = default_max_age
+    duration = time.perf_counter() - started
+
+    results = {}
+    for label, samples in sorted(recorder.samples.items()):
+        latencies = [elapsed * 1000 for elapsed, _ in samples]
+        queries = [count for _, count in samples]
+        results[label] = {
+            "requests": len(samples),
+            "errors": recorder.errors[label],
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "queries_avg": round(statistics.mean(queries), 2),
+            "queries_max": max(queries),
+        }
+    total = sum(len(samples) for samples in recorder.samples.values())
+    return {
+        "duration_s": round(duration, 2),
+        "throughput_rps": round(total / duration, 1),
+        "conn_max_age": database["CONN_MAX_AGE"]
+        if conn_max_age is None else conn_max_age,
+        "connections": recorder.connections,
+        "endpoints": results,
+    }
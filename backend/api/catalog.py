@@ -0,0 +1,85 @@
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from ingredients.models import Ingredient
+from ingredients.search import IngredientIndex
+from tags.models import Tag
+
+
+class CatalogCache:
+    """
+    Кэш редко меняющегося справочника в памяти процесса.
+    Версия справочника хранится в общем кэше Django, поэтому изменение
+    в одном воркере сбрасывает данные во всех остальных. Версию сверяем
+    не чаще раза в CATALOG_CACHE_CHECK_INTERVAL секунд.
+    """
+
+    def __init__(self, name, load):
+        self.key = f"catalog-version:{name}"
+        self.name = name
+        self.load = load
+        self.data = None
+        self.version = None
+        self.checked_at = 0
+        self.lock = Lock()
+
+    def get_version(self):
+        """Возвращаем текущую общую версию справочника."""
+        now = time.monotonic()
+        if now - self.checked_at < settings.CATALOG_CACHE_CHECK_INTERVAL:
+            return self.version
+        version = cache.get(self.key)
+        if version is None:
+            cache.add(self.key, time.time_ns(), None)
+            version = cache.get(self.key)
+        if version != self.version:
+            with self.lock:
+                self.data = None
+                self.version = version
+        self.checked_at = now
+        return version
+
+    def get(self):
+        """Возвращаем данные справочника, загружая их при необходимости."""
+        return self.snapshot()[0]
+
+    def snapshot(self):
+        """Возвращаем данные справочника вместе с их версией."""
+        version = self.get_version()
+        data = self.data
+        if data is None:
+            with self.lock:
+                if self.data is None:
+                    self.data = self.load()
+                data = self.data
+        return data, version
+
+    def invalidate(self, **kwargs):
+        """
+        Повышаем версию справочника после фиксации транзакции: раньше
+        другой воркер перечитал бы старые строки уже под новой версией.
+        """
+        transaction.on_commit(self.bump)
+
+    def bump(self):
+        with self.lock:
+            cache.set(self.key, time.time_ns(), None)
+            self.data = None
+            self.checked_at = 0
+
+    def etag(self, version):
+        return f'"{self.name}-{version}"'
+
+
+def _load_tags():
+    tags = list(Tag.objects.all())
+    return {"list": tags, "by_id": {tag.id: tag for tag in tags}}
+
+
+tag_catalog = CatalogCache("tags", _load_tags)
+ingredient_catalog = CatalogCache(
+    "ingredients", lambda: IngredientIndex(Ingredient.objects.all()))
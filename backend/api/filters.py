@@ -1,6 +1,8 @@
 from django_filters import rest_framework as filters
 from django.db.models import Exists, OuterRef
+from rest_framework.filters import OrderingFilter
 from recipes.models import Recipe, Favorite, ShoppingCart
+from tags.models import Tag
 
 
 class RecipeFilter(filters.FilterSet):
@@ -11,17 +13,24 @@ class RecipeFilter(filters.FilterSet):
     - Shopping cart (is_in_shopping_cart)
     - Author (author)
     - Tags (tags)
+    - Full-text search (search), ordered by relevance
     """
 
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart")
     author = filters.NumberFilter(field_name="author__id")
-    tags = filters.AllValuesMultipleFilter(field_name="tags__slug")
+    tags = filters.ModelMultipleChoiceFilter(
+        field_name="tags__slug",
+        to_field_name="slug",
+        queryset=Tag.objects.all(),
+    )
+    search = filters.CharFilter(method="filter_search")
 
     class Meta:
         model = Recipe
-        fields = ["is_favorited", "is_in_shopping_cart", "author", "tags"]
+        fields = ["is_favorited", "is_in_shopping_cart", "author", "tags",
+                  "search"]
 
     def filter_is_favorited(self, queryset, name, value):
         """
@@ -56,3 +65,33 @@ class RecipeFilter(filters.FilterSet):
                     user=user, recipe=OuterRef("pk")))
             )
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        """
+        Full-text search over recipe name, ingredients and description.
+        """
+        if not value.strip():
+            return queryset
+        return queryset.search(value)
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """
+    Ordering by model fields plus two shortcuts over decayed scores:
+    ``popular`` and ``trending`` put the highest scores first.
+    """
+
+    aliases = {
+        "popular": ["-popularity", "-id"],
+        "-popular": ["popularity", "id"],
+        "trending": ["-trending", "-id"],
+        "-trending": ["trending", "id"],
+    }
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        fields = [
+            field
+            for term in fields
+            for field in self.aliases.get(term, [term])
+        ]
+        return super().remove_invalid_fields(queryset, fields, view, request)
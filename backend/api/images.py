@@ -0,0 +1,138 @@
+import base64
+import binascii
+import logging
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+
+from api.response_cache import invalidate_author, invalidate_recipe
+
+logger = logging.getLogger(__name__)
+
+# Допустимые форматы изображений и расширения сохраняемых файлов.
+ALLOWED_FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+
+# Размер декодируемой за раз части строки, кратный четырём.
+CHUNK_SIZE = 64 * 1024
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS, thread_name_prefix="images")
+
+
+def decode_base64_image(data):
+    """
+    Декодируем строку data:image/...;base64 по частям во временный файл
+    и проверяем заголовок изображения, не распаковывая его целиком.
+    """
+    prefix = ";base64,"
+    start = data.find(prefix) if isinstance(data, str) else -1
+    if start == -1 or not data.startswith("data:image/"):
+        raise ValueError("Ошибка кодирования base64.")
+    start += len(prefix)
+    if (len(data) - start) // 4 * 3 > settings.IMAGE_MAX_UPLOAD_SIZE:
+        raise ValueError("Изображение слишком большое.")
+
+    file = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    try:
+        for offset in range(start, len(data), CHUNK_SIZE):
+            file.write(base64.b64decode(
+                data[offset:offset + CHUNK_SIZE], validate=True))
+        file.seek(0)
+        with Image.open(file) as image:
+            image_format = image.format
+    except (binascii.Error, OSError, Image.DecompressionBombError):
+        file.close()
+        raise ValueError("Ошибка кодирования base64.")
+    if image_format not in ALLOWED_FORMATS:
+        file.close()
+        raise ValueError(f"Формат {image_format} не поддерживается.")
+    file.seek(0)
+    return File(file, name=f"{uuid.uuid4()}.{ALLOWED_FORMATS[image_format]}")
+
+
+def process_image(instance, field, method, update_fields, on_done):
+    """
+    Обрабатываем изображение и сохраняем результат, если его не заменили
+    за время обработки. Файлы, которые вернул method, удаляем только после
+    того, как строка ссылается на новые: читатели не получают 404
+    между удалением старых файлов и записью новых.
+    """
+    model = type(instance)
+    name = getattr(instance, field).name
+    stale = getattr(instance, method)() or ()
+    # Обновляем строку, только если её не удалили и не заменили
+    # изображение за время обработки.
+    updated = model.objects.filter(pk=instance.pk, **{field: name}).update(**{
+        update_field: getattr(instance, update_field)
+        for update_field in update_fields
+    })
+    if updated:
+        for stale_name in stale:
+            default_storage.delete(stale_name)
+        on_done(instance)
+    return bool(updated)
+
+
+def make_recipe_image_variants(recipe):
+    """Создаём уменьшенные копии изображения рецепта."""
+    return process_image(
+        recipe, "image", "make_image_variants", ["image_variants"],
+        lambda recipe: invalidate_recipe(recipe.pk, recipe.author_id),
+    )
+
+
+def make_avatar_thumbnail(user):
+    """Создаём миниатюру аватара."""
+    return process_image(
+        user, "avatar", "make_avatar_thumbnail", ["avatar_thumbnail"],
+        lambda user: invalidate_author(user.pk),
+    )
+
+
+def _process(model, pk, field, name, process):
+    """Выполняем обработку изображения в фоновом потоке."""
+    try:
+        instance = model.objects.filter(pk=pk).first()
+        # Изображение могли заменить, пока задача стояла в очереди.
+        if instance is None or getattr(instance, field).name != name:
+            return
+        process(instance)
+    except Exception:
+        logger.exception(
+            "Не удалось обработать изображение %s #%s", model.__name__, pk)
+    finally:
+        connection.close()
+
+
+def _schedule(instance, field, process):
+    """
+    Ставим обработку изображения в очередь после фиксации транзакции.
+    Задача живёт только в памяти воркера, поэтому потерянные при его
+    перезапуске копии досоздают команды make_image_variants --missing
+    и make_avatar_thumbnails --missing.
+    """
+    args = (
+        type(instance),
+        instance.pk,
+        field,
+        getattr(instance, field).name,
+        process,
+    )
+    transaction.on_commit(lambda: executor.submit(_process, *args))
+
+
+def schedule_recipe_image(recipe):
+    """Создаём уменьшенные копии изображения рецепта в фоне."""
+    _schedule(recipe, "image", make_recipe_image_variants)
+
+
+def schedule_avatar_thumbnail(user):
+    """Создаём миниатюру аватара в фоне."""
+    _schedule(user, "avatar", make_avatar_thumbnail)
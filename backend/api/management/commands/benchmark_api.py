@@ -0,0 +1,116 @@
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from api.benchmark import SCENARIOS, run
+from backend.settings import BASE_DIR
+from recipes.synthetic import generate_dataset
+
+BASELINE_DIR = BASE_DIR / 'benchmarks'
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs scripted API scenarios and reports latency percentiles, "
+        "throughput and SQL queries per request for every endpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', choices=list(SCENARIOS),
+            help='Scenario to run, can be repeated (default: all)')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--seed-users', type=int, default=0,
+            help='Generate this many synthetic users before the run')
+        parser.add_argument(
+            '--seed-recipes', type=int, default=0,
+            help='Generate this many synthetic recipes before the run')
+        parser.add_argument(
+            '--conn-max-age', type=int, metavar='SECONDS',
+            help='Override CONN_MAX_AGE for the run, 0 opens a new '
+                 'database connection for every request')
+        parser.add_argument(
+            '--save', metavar='NAME',
+            help='Save results as benchmarks/NAME.json')
+        parser.add_argument(
+            '--compare', metavar='NAME',
+            help='Compare results with benchmarks/NAME.json')
+
+    def handle(self, *args, **options):
+        if options['seed_users'] or options['seed_recipes']:
+            generate_dataset(
+                users=options['seed_users'],
+                recipes=options['seed_recipes'],
+                seed=options['seed'],
+            )
+        baseline = None
+        if options['compare']:
+            path = BASELINE_DIR / f"{options['compare']}.json"
+            if not path.exists():
+                raise CommandError(f'Baseline {path} does not exist.')
+            baseline = json.loads(path.read_text())
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            try:
+                results = run(
+                    options['scenario'] or list(SCENARIOS),
+                    options['iterations'],
+                    options['concurrency'],
+                    options['seed'],
+                    options['conn_max_age'],
+                )
+            except ValueError as error:
+                raise CommandError(error)
+        results['commit'] = current_commit()
+        self.report(results, baseline)
+
+        if options['save']:
+            BASELINE_DIR.mkdir(exist_ok=True)
+            path = BASELINE_DIR / f"{options['save']}.json"
+            path.write_text(json.dumps(results, indent=2))
+            self.stdout.write(f'Saved baseline to {path}')
+
+    def report(self, results, baseline):
+        old = baseline['endpoints'] if baseline else {}
+        self.stdout.write(
+            '%-40s %6s %5s %9s %9s %9s %8s %6s' % (
+                'endpoint', 'n', 'err', 'p50 ms', 'p95 ms', 'p99 ms',
+                'queries', 'max'))
+        for label, stats in results['endpoints'].items():
+            line = '%-40s %6d %5d %9.2f %9.2f %9.2f %8.2f %6d' % (
+                label, stats['requests'], stats['errors'], stats['p50_ms'],
+                stats['p95_ms'], stats['p99_ms'], stats['queries_avg'],
+                stats['queries_max'])
+            if label in old:
+                line += '   p95 %+.0f%%, queries %+.2f' % (
+                    self.change(old[label]['p95_ms'], stats['p95_ms']),
+                    stats['queries_avg'] - old[label]['queries_avg'])
+            self.stdout.write(line)
+        summary = (
+            'Throughput: %.1f req/s over %.2f s, '
+            '%d DB connections opened (CONN_MAX_AGE=%s)' % (
+                results['throughput_rps'], results['duration_s'],
+                results['connections'], results['conn_max_age']))
+        if baseline:
+            summary += ' (baseline %.1f req/s, %s connections at %s)' % (
+                baseline['throughput_rps'],
+                baseline.get('connections', '?'), baseline.get('commit'))
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def change(self, old, new):
+        return (new - old) / old * 100 if old else 0
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from PIL import Image
+
+from api.images import make_avatar_thumbnail
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Creates thumbnails of user avatars"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Only process users that have no avatar thumbnail yet')
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(
+            Q(avatar='') | Q(avatar__isnull=True)
+        ).only('id', 'avatar', 'avatar_thumbnail').order_by('id')
+        if options['missing']:
+            users = users.filter(
+                Q(avatar_thumbnail='') | Q(avatar_thumbnail__isnull=True))
+        updated = failed = 0
+        for user in users.iterator(chunk_size=100):
+            try:
+                updated += make_avatar_thumbnail(user)
+            except (
+                OSError, ValueError, Image.DecompressionBombError
+            ) as error:
+                # Битый или пропавший аватар не должен мешать
+                # обработать остальные.
+                failed += 1
+                self.stderr.write('User #%d: %s' % (user.pk, error))
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(
+                'Created avatar thumbnails for %d users, %d failed'
+                % (updated, failed)))
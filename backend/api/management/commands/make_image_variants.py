@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from api.images import make_recipe_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Creates resized WebP and JPEG variants of recipe images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Only process recipes that have no image variants yet')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'author_id', 'image', 'image_variants').order_by('id')
+        if options['missing']:
+            recipes = recipes.filter(image_variants={})
+        updated = failed = 0
+        for recipe in recipes.iterator(chunk_size=100):
+            try:
+                updated += make_recipe_image_variants(recipe)
+            except (
+                OSError, ValueError, Image.DecompressionBombError
+            ) as error:
+                # Битое или пропавшее изображение не должно мешать
+                # обработать остальные.
+                failed += 1
+                self.stderr.write(
+                    'Recipe #%d: %s' % (recipe.pk, error))
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(
+                'Created image variants for %d recipes, %d failed'
+                % (updated, failed)))
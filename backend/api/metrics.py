@@ -0,0 +1,308 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+# Методы, которые попадают в метку method, остальные считаются как other.
+KNOWN_METHODS = {
+    "GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+
+class Histogram:
+    """Гистограмма с накопительными корзинами в формате Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {"counts": self.counts, "sum": self.sum, "count": self.count}
+
+    def merge(self, data):
+        self.counts = [
+            own + other for own, other in zip(self.counts, data["counts"])]
+        self.sum += data["sum"]
+        self.count += data["count"]
+
+    def render(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class ViewMetrics:
+    """Метрики одного эндпоинта."""
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.query_seconds = 0
+        self.duplicate_queries = 0
+        self.response_bytes = 0
+        self.statuses = Counter()
+
+    def to_dict(self):
+        return {
+            "latency": self.latency.to_dict(),
+            "queries": self.queries.to_dict(),
+            "query_seconds": self.query_seconds,
+            "duplicate_queries": self.duplicate_queries,
+            "response_bytes": self.response_bytes,
+            "statuses": self.statuses,
+        }
+
+    def merge(self, data):
+        self.latency.merge(data["latency"])
+        self.queries.merge(data["queries"])
+        self.query_seconds += data["query_seconds"]
+        self.duplicate_queries += data["duplicate_queries"]
+        self.response_bytes += data["response_bytes"]
+        self.statuses.update(
+            {int(status): count
+             for status, count in data["statuses"].items()})
+
+
+class Registry:
+    """
+    Метрики процесса, сгруппированные по имени URL и методу.
+    Если задан METRICS_DIR, каждый воркер раз в METRICS_FLUSH_INTERVAL
+    секунд сохраняет свои метрики в файл этого каталога, а при выдаче
+    метрик файлы всех воркеров складываются. Так Prometheus видит один
+    ряд на эндпоинт, в какой бы воркер ни попал запрос, а счётчики
+    завершившихся воркеров не теряются.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(ViewMetrics)
+        self.thread = None
+
+    def record(self, view, method, status, elapsed, queries, size):
+        if method not in KNOWN_METHODS:
+            method = "other"
+        durations = [duration for _, duration in queries]
+        templates = Counter(sql for sql, _ in queries)
+        with self.lock:
+            metrics = self.views[view, method]
+            metrics.latency.observe(elapsed)
+            metrics.queries.observe(len(queries))
+            metrics.query_seconds += sum(durations)
+            metrics.duplicate_queries += len(queries) - len(templates)
+            metrics.response_bytes += size
+            metrics.statuses[status] += 1
+            if settings.METRICS_DIR and self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="metrics-flush", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                f"{view}|{method}": metrics.to_dict()
+                for (view, method), metrics in self.views.items()
+            }
+
+    def flush(self):
+        """Атомарно записываем метрики процесса в его файл."""
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                    "w", dir=directory, suffix=".tmp", delete=False) as file:
+                json.dump(self.snapshot(), file)
+            os.replace(file.name, path)
+        except OSError:
+            logger.exception("Не удалось сохранить метрики в %s", path)
+
+    def collect(self):
+        """Складываем метрики всех воркеров."""
+        directory = settings.METRICS_DIR
+        if not directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            for path in glob.glob(os.path.join(directory, "*.json")):
+                try:
+                    with open(path) as file:
+                        snapshots.append(json.load(file))
+                except (OSError, ValueError):
+                    logger.warning("Пропускаем файл метрик %s", path)
+        views = defaultdict(ViewMetrics)
+        for snapshot in snapshots:
+            for key, data in snapshot.items():
+                view, method = key.rsplit("|", 1)
+                views[view, method].merge(data)
+        return views
+
+    def render(self):
+        """Выводим метрики в текстовом формате Prometheus."""
+        lines = [
+            "# TYPE foodgram_request_duration_seconds histogram",
+            "# TYPE foodgram_request_queries histogram",
+            "# TYPE foodgram_query_duration_seconds_total counter",
+            "# TYPE foodgram_duplicate_queries_total counter",
+            "# TYPE foodgram_response_bytes_total counter",
+            "# TYPE foodgram_responses_total counter",
+        ]
+        for (view, method), metrics in sorted(self.collect().items()):
+            labels = f'view="{view}",method="{method}"'
+            lines.extend(metrics.latency.render(
+                "foodgram_request_duration_seconds", labels))
+            lines.extend(metrics.queries.render(
+                "foodgram_request_queries", labels))
+            lines.append(
+                f"foodgram_query_duration_seconds_total{{{labels}}} "
+                f"{metrics.query_seconds}")
+            lines.append(
+                f"foodgram_duplicate_queries_total{{{labels}}} "
+                f"{metrics.duplicate_queries}")
+            lines.append(
+                f"foodgram_response_bytes_total{{{labels}}} "
+                f"{metrics.response_bytes}")
+            for status, count in sorted(metrics.statuses.items()):
+                lines.append(
+                    f'foodgram_responses_total{{{labels},'
+                    f'status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# SQL-запросы текущего HTTP-запроса. Контекстная переменная доступна
+# и в потоках sync_to_async, где асинхронные view обращаются к БД.
+current_queries = ContextVar("current_queries", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка выполнения SQL, запоминающая запросы и их длительность."""
+    queries = current_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.append((sql, time.perf_counter() - started))
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """Подключаем record_query к каждому новому соединению с БД."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    """
+    Собираем по каждому эндпоинту время ответа, число и время SQL-запросов,
+    повторяющиеся запросы (признак N+1) и размер ответа. Медленные запросы
+    пишем в лог вместе со списком SQL.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = []
+        token = current_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = []
+        token = current_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    def record(self, request, response, elapsed, queries):
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unresolved"
+        size = 0 if response.streaming else len(response.content)
+        registry.record(
+            view, request.method, response.status_code,
+            elapsed, queries, size,
+        )
+
+        slow_ms = settings.METRICS_SLOW_REQUEST_MS
+        if slow_ms and elapsed * 1000 >= slow_ms:
+            logger.warning(
+                "Slow request %s %s (%s): %.0f ms, %d queries\n%s",
+                request.method, request.get_full_path(), view,
+                elapsed * 1000, len(queries),
+                "\n".join(
+                    f"{duration * 1000:.1f} ms: {sql}"
+                    for sql, duration in queries
+                ),
+            )
+
+
+def metrics_view(request):
+    """
+    Отдаём метрики процесса. Доступ по токену METRICS_TOKEN в заголовке
+    Authorization: Bearer, а без него только администраторам.
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get("Authorization", "")
+    if token:
+        allowed = authorization == f"Bearer {token}"
+    else:
+        allowed = request.user.is_authenticated and request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4")
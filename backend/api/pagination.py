@@ -1,4 +1,14 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
@@ -7,3 +17,120 @@ class CustomPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "limit"
     page_query_param = "page"
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (поле сортировки, id) с непрозрачным курсором.
+    Следующая страница выбирается условием на ключ последней записи,
+    поэтому не требует OFFSET. Общее количество считается только
+    по запросу with_count=true.
+    """
+
+    page_size = 10
+    page_size_query_param = "limit"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    count_query_param = "with_count"
+    invalid_cursor_message = "Неверный курсор."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(queryset)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) == "true":
+            self.count = queryset.count()
+
+        prefix = "-" if self.descending else ""
+        ordering = [f"{prefix}{self.field}"]
+        if self.field != "id":
+            ordering.append(f"{prefix}id")
+        queryset = queryset.order_by(*ordering)
+
+        cursor = self.decode_cursor(request, queryset)
+        if cursor is not None:
+            value, pk = cursor
+            lookup = "lt" if self.descending else "gt"
+            condition = Q(**{f"{self.field}__{lookup}": value})
+            if self.field != "id":
+                condition |= Q(**{self.field: value, f"id__{lookup}": pk})
+            queryset = queryset.filter(condition)
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        response = {"next": self.get_next_link(), "results": data}
+        if self.count is not None:
+            response = {"count": self.count, **response}
+        return Response(response)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        """Определяем поле сортировки и её направление."""
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        field = ordering[0] if ordering else "id"
+        if not isinstance(field, str):
+            return "id", False
+        if field == "pk":
+            field = "id"
+        return field.lstrip("-"), field.startswith("-")
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = json.dumps(
+            [getattr(last, self.field), last.pk], cls=DjangoJSONEncoder)
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            base64.urlsafe_b64encode(cursor.encode()).decode(),
+        )
+
+    def get_field(self, queryset):
+        """Поле модели или аннотация, по которой идёт сортировка."""
+        try:
+            return queryset.model._meta.get_field(self.field)
+        except FieldDoesNotExist:
+            return queryset.query.annotations[self.field].output_field
+
+    def decode_cursor(self, request, queryset):
+        """
+        Разбираем курсор и приводим значения к типам поля сортировки
+        и id, чтобы испорченный курсор давал 404, а не ошибку в запросе.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded))
+            value = self.get_field(queryset).to_python(value)
+            if value is None or isinstance(pk, bool):
+                raise ValueError
+            pk = int(pk)
+        except (binascii.Error, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+
+def get_pagination(request):
+    """
+    Выбираем пагинацию: по ключу, если передан параметр cursor
+    (пустое значение открывает первую страницу), иначе постраничную.
+    """
+    if KeysetPagination.cursor_query_param in request.query_params:
+        return KeysetPagination()
+    return CustomPagination()
@@ -0,0 +1,210 @@
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.catalog import ingredient_catalog, tag_catalog
+from recipes.batching import on_commit_batched
+from recipes.models import Recipe
+
+# Параметры, от которых зависит лента для анонимного пользователя.
+# Фильтры is_favorited и is_in_shopping_cart для него не применяются.
+FEED_PARAMS = ("page", "limit", "tags", "author", "search", "ordering",
+               "cursor", "with_count")
+
+# Сортировки по оценкам, которые меняются без сохранения рецепта.
+SCORE_ORDERINGS = {"popular", "trending", "popularity"}
+SCORE_FIELDS = {"popularity", "trending"}
+
+# Поля пользователя, которые попадают в карточку рецепта.
+AUTHOR_FIELDS = {"email", "username", "first_name", "last_name", "avatar",
+                 "avatar_thumbnail"}
+
+
+def _version_key(scope):
+    return f"response-version:{scope}"
+
+
+def get_versions(*scopes):
+    """
+    Возвращаем версии областей кэша. Версия меняется при изменении данных,
+    поэтому ответы со старой версией в ключе просто перестают читаться.
+    """
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*scopes):
+    """
+    Меняем версии областей после фиксации транзакции: все области,
+    затронутые за транзакцию, записываются в кэш одним set_many.
+    """
+    on_commit_batched(_set_versions, *scopes)
+
+
+def _set_versions(scopes):
+    version = time.time_ns()
+    cache.set_many(
+        {_version_key(scope): version for scope in scopes}, None)
+
+
+def _make_key(kind, parts, scopes):
+    parts = [
+        *parts,
+        tag_catalog.get_version(),
+        ingredient_catalog.get_version(),
+        *get_versions(*scopes),
+    ]
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f"response:{kind}:{digest}"
+
+
+def feed_key(request, *args, **kwargs):
+    """
+    Ключ страницы ленты. Лента автора зависит только от его рецептов,
+    остальные варианты ленты от всех рецептов сразу.
+    """
+    params = request.query_params
+    parts = [(name, sorted(set(params.getlist(name))))
+             for name in FEED_PARAMS if name in params]
+    author = params.get("author")
+    if author is not None and author.isdigit():
+        scopes = [f"author:{author}"]
+    else:
+        scopes = ["feed"]
+    ordering = {term.strip().lstrip("-")
+                for term in params.get("ordering", "").split(",")}
+    if ordering & SCORE_ORDERINGS:
+        scopes.append("scores")
+    return _make_key("feed", [_origin(request), *parts], scopes)
+
+
+def recipe_key(request, id, *args, **kwargs):
+    """Ключ карточки рецепта."""
+    return _make_key("recipe", [_origin(request), id], [f"recipe:{id}"])
+
+
+def _origin(request):
+    """
+    Схема и хост запроса: ссылки на страницы и изображения в ответе
+    абсолютные, поэтому ответы для разных хостов храним отдельно.
+    """
+    return request.build_absolute_uri("/")
+
+
+def cache_anonymous_response(key_func):
+    """
+    Отдаём анонимным пользователям сохранённый ответ асинхронного get.
+    Ответы авторизованных пользователей зависят от их избранного,
+    списка покупок и подписок, поэтому не кэшируются.
+    """
+    def decorator(get):
+        @wraps(get)
+        async def wrapper(self, request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return await get(self, request, *args, **kwargs)
+            key = await sync_to_async(key_func)(request, *args, **kwargs)
+            data = await cache.aget(key)
+            if data is not None:
+                return Response(data, headers={"X-Cache": "HIT"})
+            response = await get(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                await cache.aset(
+                    key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+            response.headers["X-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorator
+
+
+def invalidate_recipe(recipe_id, author_id):
+    bump_versions("feed", f"author:{author_id}", f"recipe:{recipe_id}")
+
+
+def invalidate_author(author_id):
+    recipe_ids = Recipe.objects.filter(
+        author_id=author_id).values_list("id", flat=True)
+    bump_versions(
+        "feed", f"author:{author_id}",
+        *(f"recipe:{recipe_id}" for recipe_id in recipe_ids),
+    )
+
+
+def invalidate_recipes(recipe_ids, feed=True):
+    """
+    Сбрасываем карточки рецептов и ленты их авторов, а при feed=True
+    и общую ленту: она зависит от всех рецептов сразу.
+    """
+    rows = Recipe.objects.filter(
+        pk__in=recipe_ids).values_list("id", "author_id")
+    scopes = [
+        scope
+        for recipe_id, author_id in rows
+        for scope in (f"author:{author_id}", f"recipe:{recipe_id}")
+    ]
+    if feed:
+        scopes.append("feed")
+    bump_versions(*scopes)
+
+
+def recipes_updated(sender, recipe_ids, fields, **kwargs):
+    """
+    Рецепты изменены через QuerySet.update(). Счётчик избранного меняется
+    при каждом клике, поэтому сбрасываем только карточки рецептов и ленты
+    их авторов, а в общей ленте счётчик отстаёт не дольше
+    RESPONSE_CACHE_TIMEOUT. По той же причине ленты с сортировкой
+    по оценкам сбрасываем только после полного пересчёта оценок.
+    """
+    if recipe_ids is None:
+        if SCORE_FIELDS & set(fields):
+            bump_versions("scores")
+        return
+    if "favorites_count" in fields and recipe_ids:
+        invalidate_recipes(recipe_ids, feed=False)
+
+
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipe(instance.pk, instance.author_id)
+
+
+def recipe_ingredient_changed(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Recipe):
+        # Удаляется сам рецепт, ответы сбросит recipe_changed.
+        return
+    # Сигнал приходит на каждую строку ингредиентов, а рецепт и его автора
+    # достаточно прочитать и сбросить один раз после фиксации транзакции.
+    on_commit_batched(invalidate_recipes, instance.recipe_id)
+
+
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_recipe(instance.pk, instance.author_id)
+        return
+    # Изменили рецепты тега: instance — тег, pk_set — рецепты.
+    if action in ("post_add", "post_remove"):
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+    elif action == "pre_clear":
+        recipes = Recipe.objects.filter(tags=instance)
+    else:
+        return
+    for recipe_id, author_id in recipes.values_list("id", "author_id"):
+        invalidate_recipe(recipe_id, author_id)
+
+
+def author_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not AUTHOR_FIELDS & set(update_fields):
+        return
+    invalidate_author(instance.pk)
@@ -1,14 +1,16 @@
-import base64
-import uuid
-
-from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
 from ingredients.models import Ingredient
-from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from recipes.models import (
+    Favorite, Recipe, RecipeIngredient, ShoppingCart, SimilarRecipe
+)
 from tags.models import Tag
-from users.models import User
+from users.models import Subscription, User
+from api.images import decode_base64_image, schedule_recipe_image
 
 
 # Ограничения поля amount.
@@ -48,14 +50,9 @@ class Base64ImageField(serializers.Field):
 
     def to_internal_value(self, data):
         try:
-            format, datastr = data.split(";base64,")
-            ext = format.split("/")[-1]
-            file = ContentFile(
-                base64.b64decode(datastr), name=str(uuid.uuid4()) + "." + ext
-            )
-        except Exception:
-            raise serializers.ValidationError("Ошибка кодирования base64.")
-        return file
+            return decode_base64_image(data)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
 
     def to_representation(self, value):
         if not value:
@@ -90,6 +87,23 @@ class IngredientsSerializer(serializers.ModelSerializer):
         return super().to_representation(instance)
 
 
+def get_followed_ids(request):
+    """
+    Возвращаем ID авторов, на которых подписан текущий пользователь.
+    Множество загружается одним запросом и хранится в объекте запроса,
+    поэтому все сериализаторы запроса отвечают на is_subscribed без БД.
+    """
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+    followed_ids = getattr(request, "followed_ids", None)
+    if followed_ids is None:
+        followed_ids = frozenset(Subscription.objects.filter(
+            user=request.user
+        ).values_list("subscribed_user_id", flat=True))
+        request.followed_ids = followed_ids
+    return followed_ids
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Сериализатор для модели MyUser."""
 
@@ -109,22 +123,20 @@ class UserSerializer(serializers.ModelSerializer):
         ]
 
     def get_avatar(self, obj):
-        """Преобразуем изображение в строку Base64."""
+        """Отдаём ссылку на миниатюру аватара."""
+        if obj.avatar_thumbnail:
+            return obj.avatar_thumbnail.url
         if obj.avatar:
-            if obj.avatar and hasattr(obj.avatar, "file"):
-                encoded_string = base64.b64encode(
-                    obj.avatar.read()).decode("utf-8")
-                return f"data:image/jpeg;base64,{encoded_string}"
+            return obj.avatar.url
         return None
 
     def get_is_subscribed(self, obj):
         """
         Определяем, подписан ли текущий пользователь на данного пользователя.
         """
-        request = self.context.get("request")
-        if request and request.user.is_authenticated:
-            return obj.subscribers.filter(user=request.user).exists()
-        return False
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
+        return obj.id in get_followed_ids(self.context.get("request"))
 
 
 class RecipeSerializer(serializers.ModelSerializer):
@@ -134,6 +146,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     ingredients = IngredientsSerializer(source="recipe_ingredients", many=True)
     tags = TagSerializer(many=True, read_only=True)
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
     is_favorited = serializers.BooleanField(default=False, read_only=True)
     in_shopping_cart = serializers.SerializerMethodField(
         default=False, read_only=True)
@@ -156,13 +169,25 @@ class RecipeSerializer(serializers.ModelSerializer):
             "ingredients",
             "tags",
             "is_favorited",
+            "favorites_count",
             "name",
             "text",
             "cooking_time",
             "image",
+            "image_variants",
             "in_shopping_cart",
         ]
 
+    def get_image_variants(self, obj):
+        """Отдаём ссылки на уменьшенные копии изображения по ширинам."""
+        return {
+            width: {
+                ext: default_storage.url(name)
+                for ext, name in names.items()
+            }
+            for width, names in obj.image_variants.items()
+        }
+
     def get_is_favorited(self, obj):
         """Check if the recipe is favorited by the current user."""
         request = self.context.get("request")
@@ -173,6 +198,8 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_in_shopping_cart(self, obj):
         """Проверяем, находится ли рецепт в корзине покупок у пользователя."""
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         request = self.context.get("request")
         if request:
             if request.user.is_authenticated:
@@ -191,46 +218,119 @@ class RecipeSerializer(serializers.ModelSerializer):
                     "Каждый ингредиент должен содержать id и количество."
                 )
 
-    def create(self, validated_data):
+    def _check_ids(self, field, ids, model):
+        """
+        Проверяем одним запросом, что все объекты с переданными id
+        существуют, и перечисляем ненайденные id в ошибке.
+        """
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(
+                {field: "Значения не должны повторяться."})
+        existing = set(
+            model.objects.filter(id__in=ids).values_list("id", flat=True))
+        missing = [id for id in ids if id not in existing]
+        if missing:
+            raise serializers.ValidationError({field: {
+                "detail": "Объекты с такими id не найдены.",
+                "missing_ids": missing,
+            }})
+
+    def _to_ids(self, field, values):
+        try:
+            return [int(value) for value in values]
+        except (TypeError, ValueError):
+            raise serializers.ValidationError(
+                {field: "Идентификаторы должны быть целыми числами."})
+
+    def validate(self, attrs):
         ingredients = self.initial_data.get("ingredients")
-        tags = self.initial_data.get("tags")
         self._validate_ingredients(ingredients)
-        validated_data.pop("tags", None)
-        validated_data.pop("recipe_ingredients", None)
+        ingredient_ids = self._to_ids(
+            "ingredients", [item["id"] for item in ingredients])
+        self._check_ids("ingredients", ingredient_ids, Ingredient)
+        amounts = attrs.pop("recipe_ingredients", None) or ingredients
+        attrs["ingredient_amounts"] = {
+            id: int(item["amount"])
+            for id, item in zip(ingredient_ids, amounts)
+        }
+
+        tags = self.initial_data.get("tags")
+        if not isinstance(tags, list):
+            raise serializers.ValidationError(
+                {"tags": "Теги обязательны и должны быть списком."})
+        attrs["tag_ids"] = self._to_ids("tags", tags)
+        self._check_ids("tags", attrs["tag_ids"], Tag)
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        ingredient_amounts = validated_data.pop("ingredient_amounts")
+        tag_ids = validated_data.pop("tag_ids")
         recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(get_object_or_404(Tag, pk=id) for id in tags)
-        self._process_ingredients(recipe, ingredients)
+        recipe.tags.set(tag_ids)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in ingredient_amounts.items()
+        )
+        schedule_recipe_image(recipe)
+        self._prefetch_related(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = self.initial_data.get("ingredients")
-        print(validated_data)
-        tags = self.initial_data.get("tags")
-        self._validate_ingredients(ingredients)
-        print(instance.name, instance.text, instance.image)
-        instance.name = validated_data.get("name", instance.name)
-        instance.text = validated_data.get("text", instance.text)
-        instance.cooking_time = validated_data.get(
-            "cooking_time", instance.cooking_time
-        )
-        instance.image = validated_data.get("image", instance.image)
-        instance.tags.set(get_object_or_404(Tag, pk=id) for id in tags)
-        instance.recipe_ingredients.all().delete()
-        self._process_ingredients(instance, ingredients)
+        ingredient_amounts = validated_data.pop("ingredient_amounts")
+        tag_ids = validated_data.pop("tag_ids")
+        for field in ("name", "text", "cooking_time", "image"):
+            if field in validated_data:
+                setattr(instance, field, validated_data[field])
         instance.save()
+        instance.tags.set(tag_ids)
+        self._update_ingredients(instance, ingredient_amounts)
+        if "image" in validated_data:
+            schedule_recipe_image(instance)
+        self._prefetch_related(instance)
         return instance
 
-    def _process_ingredients(self, recipe, ingredients_data):
-        ingredients = []
-        for ingredient_data in ingredients_data:
-            ingredient = get_object_or_404(
-                Ingredient, id=ingredient_data["id"])
-            amount = ingredient_data["amount"]
-            ingredients.append(
-                RecipeIngredient(
-                    recipe=recipe, ingredient=ingredient, amount=amount)
-            )
-        recipe.recipe_ingredients.set(ingredients, bulk=False)
+    def _prefetch_related(self, recipe):
+        """Подгружаем теги и ингредиенты для ответа после записи."""
+        prefetch_related_objects(
+            [recipe],
+            "tags",
+            Prefetch(
+                "recipe_ingredients",
+                queryset=RecipeIngredient.objects.select_related(
+                    "ingredient"),
+            ),
+        )
+
+    def _update_ingredients(self, recipe, ingredient_amounts):
+        """
+        Сравниваем ингредиенты рецепта с новыми: удаляем лишние,
+        обновляем изменившиеся количества и добавляем недостающие.
+        """
+        current = {
+            row.ingredient_id: row
+            for row in recipe.recipe_ingredients.order_by()
+        }
+        removed = current.keys() - ingredient_amounts.keys()
+        if removed:
+            recipe.recipe_ingredients.filter(
+                ingredient_id__in=removed).delete()
+        changed = []
+        for ingredient_id, row in current.items():
+            amount = ingredient_amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ["amount"])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in ingredient_amounts.items()
+            if ingredient_id not in current
+        )
 
     def to_representation(self, instance):
         return super().to_representation(instance)
@@ -263,6 +363,35 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         return data
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список ID рецептов для пакетных операций."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+
+    def validate_recipes(self, value):
+        """Убираем повторы, сохраняя порядок."""
+        return list(dict.fromkeys(value))
+
+
+class RecipeMatchSerializer(serializers.Serializer):
+    """Параметры подбора рецептов по ингредиентам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+    min_coverage = serializers.FloatField(
+        min_value=0.01,
+        max_value=1,
+        default=lambda: settings.RECIPE_MATCH_MIN_COVERAGE,
+    )
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     """
     Сериализатор для модели Favorite.
@@ -279,6 +408,19 @@ class FavoriteSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "image", "cooking_time"]
 
 
+class SimilarRecipeSerializer(serializers.ModelSerializer):
+    """Сериализатор похожего рецепта со степенью сходства."""
+
+    id = serializers.ReadOnlyField(source="similar.id")
+    name = serializers.ReadOnlyField(source="similar.name")
+    image = serializers.ImageField(source="similar.image", read_only=True)
+    cooking_time = serializers.ReadOnlyField(source="similar.cooking_time")
+
+    class Meta:
+        model = SimilarRecipe
+        fields = ["id", "name", "image", "cooking_time", "score"]
+
+
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
     """Сериализатор для минимизированного представления рецепта."""
 
@@ -287,16 +429,13 @@ class RecipeMinifiedSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "image", "cooking_time"]
 
 
-class UserWithRecipesSerializer(serializers.ModelSerializer):
+class UserWithRecipesSerializer(UserSerializer):
     """Сериализатор пользователя с его рецептами и информацией о подписке."""
 
     recipes = RecipeMinifiedSerializer(many=True)
-    is_subscribed = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source="recipes.count", read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
 
-    class Meta:
-        model = User
+    class Meta(UserSerializer.Meta):
         fields = [
             "id",
             "username",
@@ -308,12 +447,3 @@ class UserWithRecipesSerializer(serializers.ModelSerializer):
             "recipes_count",
             "avatar",
         ]
-
-    def get_is_subscribed(self, obj):
-        """
-        Определяем, подписан ли текущий пользователь на данного пользователя.
-        """
-        request = self.context.get("request")
-        if request and request.user.is_authenticated:
-            return obj.subscribers.filter(user=request.user).exists()
-        return False
@@ -0,0 +1,147 @@
+import atexit
+import logging
+import secrets
+import string
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.http import Http404, HttpResponseRedirect
+
+from recipes.models import Recipe, ShortLink
+
+logger = logging.getLogger(__name__)
+
+BASE62 = string.digits + string.ascii_letters
+
+# Сколько раз пробуем подобрать свободный код, прежде чем сдаться.
+CODE_ATTEMPTS = 5
+
+
+class LRUCache:
+    """Потокобезопасный кэш с вытеснением давно не использованных ключей."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.get(key)
+            if value is not None:
+                self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+class HitCounter:
+    """
+    Копим переходы по ссылкам в памяти и раз в SHORT_LINK_FLUSH_INTERVAL
+    секунд записываем их в БД из фонового потока, по одному UPDATE
+    на каждое встретившееся число переходов.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.hits = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def add(self, code):
+        with self.lock:
+            self.hits[code] += 1
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="short-link-hits", daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            hits, self.hits = self.hits, Counter()
+        if not hits:
+            return
+        codes_by_count = defaultdict(list)
+        for code, count in hits.items():
+            codes_by_count[count].append(code)
+        try:
+            with transaction.atomic():
+                for count, codes in codes_by_count.items():
+                    ShortLink.objects.filter(code__in=codes).update(
+                        hits=F("hits") + count)
+        except Exception:
+            logger.exception("Не удалось сохранить переходы по ссылкам")
+        finally:
+            connection.close()
+
+
+links = LRUCache(settings.SHORT_LINK_CACHE_SIZE)
+hit_counter = HitCounter(settings.SHORT_LINK_FLUSH_INTERVAL)
+atexit.register(hit_counter.flush)
+
+
+def generate_code():
+    return "".join(
+        secrets.choice(BASE62) for _ in range(settings.SHORT_LINK_LENGTH))
+
+
+def get_code(recipe_id):
+    """
+    Возвращаем код короткой ссылки на рецепт, создавая его при первом
+    обращении. Если рецепта нет, возвращаем None.
+    """
+    code = ShortLink.objects.filter(
+        recipe_id=recipe_id).values_list("code", flat=True).first()
+    if code is not None:
+        return code
+    if not Recipe.objects.filter(id=recipe_id).exists():
+        return None
+    for _ in range(CODE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                link = ShortLink.objects.create(
+                    code=generate_code(), recipe_id=recipe_id)
+        except IntegrityError:
+            # Код занят или ссылку уже создал параллельный запрос.
+            code = ShortLink.objects.filter(
+                recipe_id=recipe_id).values_list("code", flat=True).first()
+            if code is not None:
+                return code
+            continue
+        return link.code
+    raise IntegrityError("Не удалось подобрать свободный код ссылки.")
+
+
+def short_link_deleted(sender, instance, **kwargs):
+    links.delete(instance.code)
+
+
+async def short_link_redirect(request, code):
+    """Перенаправляем с короткой ссылки на страницу рецепта."""
+    recipe_id = links.get(code)
+    if recipe_id is None:
+        try:
+            recipe_id = await ShortLink.objects.values_list(
+                "recipe_id", flat=True).aget(code=code)
+        except ShortLink.DoesNotExist:
+            raise Http404
+        links.set(code, recipe_id)
+    hit_counter.add(code)
+    return HttpResponseRedirect(f"/recipes/{recipe_id}")
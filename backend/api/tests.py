@@ -0,0 +1,489 @@
+import base64
+import json
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from ingredients.models import Ingredient
+from recipes.matching import recipe_index
+from recipes.models import (
+    Favorite, Recipe, RecipeIngredient, ShoppingCart, TimelineEntry
+)
+from tags.models import Tag
+from users.models import Subscription, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def create_user(username):
+    return User.objects.create_user(
+        email=f'{username}@example.com',
+        username=username,
+        password='password',
+        first_name='Имя',
+        last_name='Фамилия',
+    )
+
+
+def create_recipe(author, name, ingredients=(), cooking_time=10):
+    recipe = Recipe(
+        name=name,
+        author=author,
+        text='Описание',
+        cooking_time=cooking_time,
+    )
+    recipe.image.save('recipe.png', ContentFile(b'image'), save=False)
+    recipe.save()
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=j + 1)
+        for j, ingredient in enumerate(ingredients)
+    )
+    return recipe
+
+
+def result_ids(response):
+    return [item['id'] for item in response.data['results']]
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов ленты рецептов не зависит от размера страницы."""
+
+    LIMITS = (2, 10, 25)
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = [create_user(f'author{i}') for i in range(3)]
+        cls.user = create_user('reader')
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}')
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(10)
+        ]
+        for i in range(30):
+            recipe = create_recipe(
+                authors[i % len(authors)],
+                f'Рецепт {i}',
+                [ingredients[(i + j) % len(ingredients)] for j in range(4)],
+            )
+            recipe.tags.set(tags[:1 + i % len(tags)])
+            if i % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if i % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Subscription.objects.create(user=cls.user, subscribed_user=authors[0])
+
+    def setUp(self):
+        # Ответы анонимным пользователям кэшируются.
+        cache.clear()
+
+    def assert_constant_queries(self, num):
+        for limit in self.LIMITS:
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(num):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        # COUNT, страница рецептов, авторы, теги, ингредиенты.
+        self.assert_constant_queries(5)
+
+    def test_authenticated(self):
+        # Флаги избранного и списка покупок считаются в запросе страницы,
+        # подписки пользователя читаются одним запросом.
+        self.client.force_authenticate(self.user)
+        self.assert_constant_queries(6)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BulkRecipeListTest(APITestCase):
+    """Пакетное добавление и удаление рецептов из списков пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        author = create_user('author')
+        cls.recipes = [
+            create_recipe(author, f'Рецепт {i}') for i in range(3)]
+        cls.missing_id = cls.recipes[-1].id + 1
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def assert_scores(self, recipe, favorites_count, popularity):
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, favorites_count)
+        self.assertAlmostEqual(recipe.popularity, popularity, places=4)
+        self.assertAlmostEqual(recipe.trending, popularity, places=4)
+
+    def test_add_favorites(self):
+        first, second, _ = self.recipes
+        response = self.client.post(
+            '/api/recipes/favorite/',
+            {'recipes': [first.id, second.id, second.id, self.missing_id]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        # Повторы схлопываются, порядок ID сохраняется.
+        self.assertEqual(response.data['results'], [
+            {'id': first.id, 'status': 'exists'},
+            {'id': second.id, 'status': 'added'},
+            {'id': self.missing_id, 'status': 'not_found'},
+        ])
+        self.assertEqual(
+            set(self.user.favorites.values_list('recipe_id', flat=True)),
+            {first.id, second.id},
+        )
+        self.assert_scores(first, 1, 1.0)
+        self.assert_scores(second, 1, 1.0)
+
+    def test_remove_favorites(self):
+        first, _, third = self.recipes
+        response = self.client.delete(
+            '/api/recipes/favorite/',
+            {'recipes': [first.id, third.id, first.id, self.missing_id]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'id': first.id, 'status': 'removed'},
+            {'id': third.id, 'status': 'missing'},
+            {'id': self.missing_id, 'status': 'missing'},
+        ])
+        self.assertFalse(self.user.favorites.exists())
+        self.assert_scores(first, 0, 0.0)
+        self.assert_scores(third, 0, 0.0)
+
+    def test_shopping_cart(self):
+        first, second, _ = self.recipes
+        response = self.client.post(
+            '/api/recipes/shopping_cart/',
+            {'recipes': [second.id]},
+            format='json',
+        )
+        self.assertEqual(
+            response.data['results'], [{'id': second.id, 'status': 'added'}])
+        # Список покупок весит вдвое меньше избранного
+        # и не меняет счётчик избранного.
+        self.assert_scores(second, 0, 0.5)
+        response = self.client.delete(
+            '/api/recipes/shopping_cart/',
+            {'recipes': [first.id, second.id]},
+            format='json',
+        )
+        self.assertEqual(response.data['results'], [
+            {'id': first.id, 'status': 'missing'},
+            {'id': second.id, 'status': 'removed'},
+        ])
+        self.assert_scores(first, 1, 1.0)
+        self.assert_scores(second, 0, 0.0)
+
+    def test_invalid_request(self):
+        for data in ({}, {'recipes': []}, {'recipes': ['abc']}):
+            with self.subTest(data=data):
+                response = self.client.post(
+                    '/api/recipes/favorite/', data, format='json')
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class KeysetPaginationTest(APITestCase):
+    """Пагинация ленты рецептов по курсору."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        cls.recipes = [
+            create_recipe(author, f'Рецепт {i}', cooking_time=i % 3 + 1)
+            for i in range(10)
+        ]
+
+    def setUp(self):
+        # Ответы анонимным пользователям кэшируются.
+        cache.clear()
+
+    def walk(self, params):
+        """Проходим ленту по ссылкам next и возвращаем ID рецептов."""
+        ids = []
+        response = self.client.get(
+            '/api/recipes/', {'cursor': '', 'limit': 4, **params})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(result_ids(response))
+            if response.data['next'] is None:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_round_trip(self):
+        cases = {
+            '': lambda recipe: (recipe.name, recipe.id),
+            'cooking_time': lambda recipe: (recipe.cooking_time, recipe.id),
+            '-cooking_time': lambda recipe: (
+                -recipe.cooking_time, -recipe.id),
+        }
+        for ordering, key in cases.items():
+            with self.subTest(ordering=ordering):
+                params = {'ordering': ordering} if ordering else {}
+                expected = [
+                    recipe.id for recipe in sorted(self.recipes, key=key)]
+                self.assertEqual(self.walk(params), expected)
+
+    def test_count(self):
+        response = self.client.get(
+            '/api/recipes/', {'cursor': '', 'with_count': 'true'})
+        self.assertEqual(response.data['count'], len(self.recipes))
+
+    def test_invalid_cursor(self):
+        def encode(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode())
+
+        cursors = [
+            'not a cursor',
+            encode('abc'),
+            encode(['abc', 1]),
+            encode([1, 'abc']),
+            encode([1, True]),
+            encode([None, 1]),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/recipes/', {
+                    'cursor': cursor, 'ordering': 'cooking_time'})
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CountersTest(APITestCase):
+    """Счётчики рецептов, подписчиков и избранного."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.author = create_user('author')
+        cls.recipe = create_recipe(cls.author, 'Рецепт')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_count(self):
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+        recipe = create_recipe(self.author, 'Ещё рецепт')
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 2)
+        recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+
+    def test_subscribers_count(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['recipes_count'], 1)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 0)
+
+    def test_favorites_count(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.data['favorites_count'], 1)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT, FEED_FANOUT_LIMIT=1, FEED_BACKFILL_SIZE=2)
+class FollowedFeedTest(APITestCase):
+    """
+    Лента подписок: рецепты авторов с числом подписчиков не больше
+    FEED_FANOUT_LIMIT раскладываются по лентам, рецепты популярных
+    авторов добавляются при чтении.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.follower = create_user('follower')
+        cls.author = create_user('author')
+        cls.star = create_user('star')
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.author_recipes = [
+                create_recipe(cls.author, f'Рецепт {i}') for i in range(3)]
+            cls.star_recipes = [
+                create_recipe(cls.star, f'Хит {i}') for i in range(3)]
+            Subscription.objects.create(
+                user=cls.follower, subscribed_user=cls.star)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def subscribe(self, author):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+
+    def publish(self, author):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_recipe(author, 'Новый рецепт')
+
+    def get_feed(self):
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        return result_ids(response)
+
+    def get_timeline(self):
+        return set(TimelineEntry.objects.filter(
+            user=self.user).values_list('recipe_id', flat=True))
+
+    def test_backfill_on_subscribe(self):
+        self.subscribe(self.author)
+        # В ленту попадают FEED_BACKFILL_SIZE последних рецептов автора.
+        expected = [recipe.id for recipe in self.author_recipes[:0:-1]]
+        self.assertEqual(self.get_feed(), expected)
+        self.assertEqual(self.get_timeline(), set(expected))
+
+    def test_fan_out(self):
+        self.subscribe(self.author)
+        recipe = self.publish(self.author)
+        self.assertIn(recipe.id, self.get_timeline())
+        self.assertEqual(self.get_feed()[0], recipe.id)
+
+    def test_popular_author(self):
+        self.subscribe(self.star)
+        recipe = self.publish(self.star)
+        # Рецепты популярного автора не раскладываются, а читаются все.
+        self.assertEqual(self.get_timeline(), set())
+        self.assertEqual(
+            self.get_feed(),
+            [recipe.id] + [item.id for item in self.star_recipes[::-1]],
+        )
+
+    def test_unsubscribe(self):
+        self.subscribe(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_timeline(), set())
+        self.assertEqual(self.get_feed(), [])
+
+    def test_fan_out_resumed(self):
+        self.subscribe(self.star)
+        recipe = self.publish(self.star)
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.filter(user=self.follower).delete()
+        # Автор снова раскладывает рецепты, и ленты подписчиков
+        # дополняются его последними рецептами.
+        expected = [recipe.id, self.star_recipes[-1].id]
+        self.assertEqual(self.get_timeline(), set(expected))
+        self.assertEqual(self.get_feed(), expected)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPE_INDEX_SYNC_INTERVAL=0)
+class RecipeMatchTest(APITestCase):
+    """Подбор рецептов по имеющимся ингредиентам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        a, b, c, d, e = cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(5)
+        ]
+        # Отметки об изменениях пишутся после фиксации транзакции.
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.recipes = [
+                create_recipe(author, f'Рецепт {i}', ingredients)
+                for i, ingredients in enumerate([
+                    [a, b], [a, b, c, d], [a, c, d], [c, d], [a, b, c, d],
+                    [a, e],
+                ])
+            ]
+
+    def setUp(self):
+        # Индекс живёт в памяти процесса, загружаем его из тестовой БД.
+        recipe_index.postings = None
+        self.addCleanup(setattr, recipe_index, 'postings', None)
+
+    def match(self, ingredients, **params):
+        response = self.client.get('/api/recipes/match/', {
+            'ingredients': [item.id for item in ingredients], **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def ranking(self, response):
+        return [
+            (self.recipes.index(Recipe(id=item['id'])), item['coverage'])
+            for item in response.data['results']
+        ]
+
+    def test_ranking(self):
+        a, b = self.ingredients[:2]
+        response = self.match([a, b], min_coverage=0.3)
+        self.assertEqual(response.data['count'], 5)
+        # При равном покрытии выше рецепт с большим числом совпавших
+        # ингредиентов, затем более новый.
+        self.assertEqual(self.ranking(response), [
+            (0, 1.0), (4, 0.5), (1, 0.5), (5, 0.5), (2, 0.3333)])
+
+    def test_min_coverage(self):
+        a, b = self.ingredients[:2]
+        response = self.match([a, b])
+        self.assertEqual(response.data['count'], 4)
+        response = self.match([a, b], min_coverage=1)
+        self.assertEqual(self.ranking(response), [(0, 1.0)])
+
+    def test_pages(self):
+        a, b = self.ingredients[:2]
+        response = self.match([a, b], limit=2, page=2)
+        self.assertEqual(self.ranking(response), [(1, 0.5), (5, 0.5)])
+
+    def test_recipe_changed(self):
+        a, b, c = self.ingredients[:3]
+        self.match([a, b])
+        recipe = self.recipes[3]
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient=c).delete()
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(recipe=recipe, ingredient=a, amount=1),
+                RecipeIngredient(recipe=recipe, ingredient=b, amount=1),
+            ])
+            recipe.save()
+        response = self.match([a, b])
+        self.assertEqual(self.ranking(response)[:2], [(0, 1.0), (3, 0.6667)])
+
+    def test_invalid_request(self):
+        for params in ({}, {'ingredients': 'abc'},
+                       {'ingredients': 1, 'min_coverage': 0}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/recipes/match/', params)
+                self.assertEqual(response.status_code, 400)
@@ -1,16 +1,22 @@
 from django.urls import include, path
 
+from api.metrics import metrics_view
 from api.views import (
     AddRecipeToShoppingListView,
+    BulkFavoritesView,
+    BulkShoppingCartView,
     ChangePasswordView,
     CurrentUserView,
     DownloadShoppingListView,
+    FollowedFeedView,
     IngredientDetailView,
     IngredientListView,
     RecipeAPIView,
     RecipeDetailView,
+    RecipeMatchView,
     RecipeShortLinkView,
     RecipeFavoritesView,
+    SimilarRecipesView,
     SubscriptionsView,
     SubscribeView,
     TagDetailView,
@@ -22,6 +28,8 @@ from api.views import (
 
 
 urlpatterns = [
+    # Метрики в формате Prometheus.
+    path("metrics/", metrics_view, name="metrics"),
     # Получение токена.
     path("auth/", include("djoser.urls.authtoken")),
     path("auth/users/", include("djoser.urls")),
@@ -61,6 +69,15 @@ urlpatterns = [
     # Получаем рецепт.
     path("recipes/<int:id>/", RecipeDetailView.as_view(),
          name="recipe-detail"),
+    # Похожие рецепты.
+    path("recipes/<int:id>/similar/", SimilarRecipesView.as_view(),
+         name="recipe-similar"),
+    # Лента рецептов авторов из подписок.
+    path("recipes/feed/", FollowedFeedView.as_view(),
+         name="recipe-followed-feed"),
+    # Подбор рецептов по имеющимся ингредиентам.
+    path("recipes/match/", RecipeMatchView.as_view(),
+         name="recipe-match"),
     # Короткая ссылка.
     path(
         "recipes/<int:id>/get-link/",
@@ -73,6 +90,18 @@ urlpatterns = [
         DownloadShoppingListView.as_view(),
         name="download-shopping-list",
     ),
+    # Добавить или удалить несколько рецептов из списка покупок.
+    path(
+        "recipes/shopping_cart/",
+        BulkShoppingCartView.as_view(),
+        name="bulk-shopping-list",
+    ),
+    # Добавить или удалить несколько рецептов из избранного.
+    path(
+        "recipes/favorite/",
+        BulkFavoritesView.as_view(),
+        name="bulk-favorites",
+    ),
     # Добавить рецепт в список покупок. Удалить рецепт из списка покупок.
     path(
         "recipes/<int:id>/shopping_cart/",
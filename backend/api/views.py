@@ -1,23 +1,32 @@
-import base64
-import uuid
+import csv
+from functools import wraps
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import BooleanField, Prefetch, Sum, Value
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils import timezone
 from django.views import View
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 
 from djoser.views import UserViewSet as djoser_UserViewSet
 
-from rest_framework import generics, filters, status, permissions
+from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.mixins import RetrieveModelMixin
 from rest_framework.permissions import IsAuthenticated
 
-from ingredients.models import Ingredient
-from recipes.models import Recipe, ShoppingCart, Favorite
-from tags.models import Tag
+from recipes import popularity
+from recipes.matching import recipe_index
+from recipes.models import (
+    Recipe, RecipeIngredient, ShoppingCart, Favorite, SimilarRecipe
+)
+from recipes.signals import change_counters
+from recipes.timeline import feed
 from users.models import User, Subscription
 from api.serializers import (
     IngredientSerializer,
@@ -27,59 +36,116 @@ from api.serializers import (
     UserWithRecipesSerializer,
     ShoppingCartSerializer,
     FavoriteSerializer,
+    RecipeIdsSerializer,
+    RecipeMatchSerializer,
+    SimilarRecipeSerializer,
+    get_followed_ids,
 )
-from api.pagination import CustomPagination
-from api.filters import RecipeFilter
+from api.async_views import AsyncAPIView
+from api.catalog import ingredient_catalog, tag_catalog
+from api.images import decode_base64_image, schedule_avatar_thumbnail
+from api.pagination import CustomPagination, KeysetPagination, get_pagination
+from api.response_cache import cache_anonymous_response, feed_key, recipe_key
+from api.short_links import get_code
+from api.filters import RecipeFilter, RecipeOrderingFilter
 
 
-class IngredientListView(generics.ListAPIView):
+def catalog_conditional(catalog):
+    """
+    Отдаём ETag и Last-Modified по версии справочника и отвечаем 304,
+    если у клиента актуальная копия. Данные справочника, загруженные
+    в отдельном потоке, сохраняем в self.catalog_data для асинхронного get.
+    """
+    def decorator(view_class):
+        get = view_class.get
+
+        @wraps(get)
+        async def wrapper(self, request, *args, **kwargs):
+            data, version = await sync_to_async(catalog.snapshot)()
+            etag = catalog.etag(version)
+            last_modified = version // 10 ** 9
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is None:
+                self.catalog_data = data
+                response = await get(self, request, *args, **kwargs)
+            if response.status_code in (
+                    status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+                response.headers["ETag"] = etag
+                response.headers["Last-Modified"] = http_date(last_modified)
+            patch_cache_control(response, no_cache=True)
+            return response
+
+        view_class.get = wrapper
+        return view_class
+    return decorator
+
+
+@catalog_conditional(ingredient_catalog)
+class IngredientListView(AsyncAPIView, generics.ListAPIView):
     """
     Получаем список ингредиентов с возможностью поиска по имени.
+    Поиск не учитывает регистр: сначала идут ингредиенты, название которых
+    начинается с запроса, затем те, в которых запрос встречается внутри.
     """
 
     serializer_class = IngredientSerializer
 
+    async def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
     def get_queryset(self):
-        name = self.request.query_params.get("name", None)
-        queryset = Ingredient.objects.all()
-        if name:
-            queryset = queryset.filter(name__startswith=name)
-        return queryset
+        name = self.request.query_params.get("name", "")
+        return self.catalog_data.search(name)
 
 
-class IngredientDetailView(generics.RetrieveAPIView):
+@catalog_conditional(ingredient_catalog)
+class IngredientDetailView(AsyncAPIView, generics.RetrieveAPIView):
     """Получаем ингредиент по его ID."""
 
-    queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    lookup_field = "id"
 
+    async def get(self, request, *args, **kwargs):
+        return self.retrieve(request, *args, **kwargs)
+
+    def get_object(self):
+        ingredient = self.catalog_data.by_id.get(self.kwargs["id"])
+        if ingredient is None:
+            raise Http404
+        return ingredient
 
-class RecipeAPIView(APIView):
+
+class RecipeAPIView(AsyncAPIView):
     """
     Unified API view for Recipe operations: list, create, update, and delete.
+    Listing is asynchronous, writes run in a thread via sync_to_async.
     """
 
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    pagination_class = CustomPagination
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, RecipeOrderingFilter]
     filterset_class = RecipeFilter
+    ordering_fields = ["id", "name", "cooking_time", "favorites_count",
+                       "popularity", "trending"]
 
     def get_queryset(self):
-        return Recipe.objects.all()
+        return Recipe.objects.with_related(self.request.user)
 
-    def get(self, request, *args, **kwargs):
+    @cache_anonymous_response(feed_key)
+    async def get(self, request, *args, **kwargs):
         """List recipes."""
-        queryset = self.filter_queryset(self.get_queryset())
-        paginator = self.pagination_class()
-        page = paginator.paginate_queryset(queryset, request)
-        if page is not None:
-            serializer = RecipeSerializer(page, many=True,
-                                          context={"request": request})
-            return paginator.get_paginated_response(serializer.data)
-        serializer = RecipeSerializer(queryset, many=True,
+        paginator = get_pagination(request)
+        page = await sync_to_async(self.paginate)(paginator)
+        # Связанные объекты уже подгружены, сериализация не ходит в БД.
+        serializer = RecipeSerializer(page, many=True,
                                       context={"request": request})
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
+
+    def paginate(self, paginator):
+        """Filter the queryset and fetch the requested page."""
+        queryset = self.filter_queryset(self.get_queryset())
+        page = list(paginator.paginate_queryset(queryset, self.request))
+        get_followed_ids(self.request)
+        return page
 
     def post(self, request, *args, **kwargs):
         """Create a new recipe."""
@@ -123,15 +189,21 @@ class RecipeAPIView(APIView):
                 self.permission_denied(request)
 
 
-class RecipeDetailView(RetrieveModelMixin, APIView):
+class RecipeDetailView(AsyncAPIView):
     """Получаем детальную информацию о рецепте по ID."""
 
     permission_classes = [permissions.AllowAny]
     serializer_class = RecipeSerializer
 
-    def get(self, request, id, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, id=id)
-        serializer = self.serializer_class(recipe)
+    @cache_anonymous_response(recipe_key)
+    async def get(self, request, id, *args, **kwargs):
+        recipe = await Recipe.objects.with_related(
+            request.user).filter(id=id).afirst()
+        if recipe is None:
+            raise Http404
+        await sync_to_async(get_followed_ids)(request)
+        serializer = self.serializer_class(
+            recipe, context={"request": request})
         return Response(serializer.data)
 
     def patch(self, request, id, *args, **kwargs):
@@ -156,30 +228,156 @@ class RecipeDetailView(RetrieveModelMixin, APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RecipeShortLinkView(APIView):
+class SimilarRecipesView(AsyncAPIView):
+    """
+    Похожие рецепты. Соседи рассчитаны заранее командой
+    build_similar_recipes и читаются одним запросом.
+    """
+
+    permission_classes = [permissions.AllowAny]
+
+    async def get(self, request, id, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get("limit", ""))
+        except ValueError:
+            limit = settings.SIMILAR_RECIPES_COUNT
+        limit = max(1, min(limit, settings.SIMILAR_RECIPES_COUNT))
+        similar = [
+            item async for item in SimilarRecipe.objects.filter(
+                recipe_id=id
+            ).select_related("similar").order_by("-score")[:limit]
+        ]
+        if not similar and not await Recipe.objects.filter(id=id).aexists():
+            raise Http404
+        serializer = SimilarRecipeSerializer(
+            similar, many=True, context={"request": request})
+        return Response(serializer.data)
+
+
+class FollowedFeedView(APIView):
+    """
+    Лента новых рецептов авторов, на которых подписан пользователь,
+    от новых к старым. Пагинация по курсору.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        recipes = feed(request.user).with_related(
+            request.user).order_by("-id")
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(recipes, request, view=self)
+        serializer = RecipeSerializer(
+            page, many=True, context={"request": request})
+        return paginator.get_paginated_response(serializer.data)
+
+
+class RecipeMatchView(APIView):
+    """
+    Подбираем рецепты по имеющимся у пользователя ингредиентам.
+    Рецепты упорядочены по доле своих ингредиентов, которые есть
+    у пользователя, и не опускаются ниже порога min_coverage.
+    """
+
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        params = RecipeMatchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        matches = recipe_index.match(
+            params.validated_data["ingredients"],
+            params.validated_data["min_coverage"],
+        )
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(matches, request, view=self)
+        coverage = {recipe_id: value for value, _, recipe_id in page}
+        recipes = Recipe.objects.with_related(request.user).in_bulk(coverage)
+        # Рецепт могли удалить до того, как воркер обновил индекс.
+        page = [recipes[recipe_id] for recipe_id in coverage
+                if recipe_id in recipes]
+        serializer = RecipeSerializer(
+            page, many=True, context={"request": request})
+        data = serializer.data
+        for item in data:
+            item["coverage"] = round(coverage[item["id"]], 4)
+        return paginator.get_paginated_response(data)
+
+
+class RecipeShortLinkView(AsyncAPIView):
     """Получаем сокращенную ссылку на рецепт по его ID."""
 
     permission_classes = [permissions.AllowAny]
 
-    def get(self, request, id, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, id=id)
-        short_link = f"{settings.SITE_URL}/r/{recipe.id}"
+    async def get(self, request, id, *args, **kwargs):
+        code = await sync_to_async(get_code)(id)
+        if code is None:
+            raise Http404
+        short_link = f"{settings.SITE_URL}/r/{code}"
         return Response({"short-link": short_link})
 
 
+class Echo:
+    """Буфер для csv.writer, который сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
 class DownloadShoppingListView(APIView):
-    """Скачиваем файл со списком покупок."""
+    """
+    Скачиваем файл со списком покупок.
+    Количество одинаковых ингредиентов суммируется одним запросом к БД,
+    формат файла задаётся параметром type: txt (по умолчанию) или csv.
+    """
 
     permission_classes = [permissions.IsAuthenticated]
+    content_types = {
+        "txt": "text/plain; charset=utf-8",
+        "csv": "text/csv; charset=utf-8",
+    }
 
     def get(self, request, *args, **kwargs):
-        shopping_list = ShoppingCart.objects.filter(user=request.user)
-        file_content = "\n".join([str(item) for item in shopping_list])
-        response = Response(file_content, content_type="text/plain")
+        file_type = request.query_params.get("type", "txt")
+        if file_type not in self.content_types:
+            return Response(
+                {"type": [f"Доступные форматы: "
+                          f"{', '.join(self.content_types)}."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        ingredients = (
+            RecipeIngredient.objects
+            .filter(recipe__in_shopping_cart__user=request.user)
+            .values("ingredient__name", "ingredient__measurement_unit")
+            .annotate(total_amount=Sum("amount"))
+            .order_by("ingredient__name")
+            .values_list(
+                "ingredient__name",
+                "ingredient__measurement_unit",
+                "total_amount",
+            )
+            .iterator()
+        )
+        if file_type == "csv":
+            content = self._csv_lines(ingredients)
+        else:
+            content = self._text_lines(ingredients)
+        response = StreamingHttpResponse(
+            content, content_type=self.content_types[file_type])
         response["Content-Disposition"] = \
-            'attachment; filename="shopping_list.txt"'
+            f'attachment; filename="shopping_list.{file_type}"'
         return response
 
+    def _text_lines(self, ingredients):
+        for name, measurement_unit, amount in ingredients:
+            yield f"{name} ({measurement_unit}) — {amount}\n"
+
+    def _csv_lines(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ["Ингредиент", "Единица измерения", "Количество"])
+        for row in ingredients:
+            yield writer.writerow(row)
+
 
 class AddRecipeToShoppingListView(APIView):
     """Добавляем рецепт в список покупок."""
@@ -233,19 +431,153 @@ class RecipeFavoritesView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagListView(generics.ListAPIView):
+class BulkRecipeListView(APIView):
+    """
+    Добавляем или убираем сразу несколько рецептов из списка пользователя.
+    Принимаем {"recipes": [id, ...]} и возвращаем результат для каждого ID.
+    Число запросов к БД не зависит от количества рецептов.
+    """
+
+    permission_classes = [IsAuthenticated]
+    model = None
+
+    def get_recipe_ids(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data["recipes"]
+
+    def post(self, request, *args, **kwargs):
+        recipe_ids = self.get_recipe_ids(request)
+        with transaction.atomic():
+            found = set(Recipe.objects.filter(
+                id__in=recipe_ids).values_list("id", flat=True))
+            added = self.insert_items(
+                request.user, [pk for pk in recipe_ids if pk in found])
+            if added:
+                self.recipes_added(list(added))
+        results = [
+            {"id": pk, "status": "added" if pk in added else "exists"}
+            if pk in found else {"id": pk, "status": "not_found"}
+            for pk in recipe_ids
+        ]
+        return Response({"results": results})
+
+    def delete(self, request, *args, **kwargs):
+        recipe_ids = self.get_recipe_ids(request)
+        with transaction.atomic():
+            removed = self.delete_items(request.user, recipe_ids)
+            if removed:
+                self.recipes_removed(removed)
+        results = [
+            {"id": pk, "status": "removed" if pk in removed else "missing"}
+            for pk in recipe_ids
+        ]
+        return Response({"results": results})
+
+    def insert_items(self, user, recipe_ids):
+        """
+        Добавляем рецепты одним INSERT … ON CONFLICT DO NOTHING и возвращаем
+        ID только реально вставленных: строки, которые успел добавить
+        параллельный запрос, пропускаются и в счётчиках не учитываются.
+        """
+        if not recipe_ids:
+            return set()
+        meta = self.model._meta
+        created_at = meta.get_field("created_at").get_db_prep_save(
+            timezone.now(), connection)
+        sql = (
+            f"INSERT INTO {self.quote(meta.db_table)} "
+            f"({self.column('user')}, {self.column('recipe')}, "
+            f"{self.column('created_at')}) "
+            f"VALUES {', '.join(['(%s, %s, %s)'] * len(recipe_ids))} "
+            f"ON CONFLICT DO NOTHING "
+            f"RETURNING {self.column(meta.pk.name)}, {self.column('recipe')}"
+        )
+        params = [
+            value for pk in recipe_ids for value in (user.pk, pk, created_at)]
+        return {item.recipe_id for item in self.model.objects.raw(sql, params)}
+
+    def delete_items(self, user, recipe_ids):
+        """
+        Удаляем рецепты одним DELETE … RETURNING без обхода объектов
+        и сигналов и возвращаем {id рецепта: время добавления} только
+        для реально удалённых строк: строки, удалённые параллельным
+        запросом, второй раз не вычитаются из счётчиков.
+        """
+        meta = self.model._meta
+        sql = (
+            f"DELETE FROM {self.quote(meta.db_table)} "
+            f"WHERE {self.column('user')} = %s AND {self.column('recipe')} "
+            f"IN ({', '.join(['%s'] * len(recipe_ids))}) "
+            f"RETURNING {self.column(meta.pk.name)}, {self.column('recipe')}, "
+            f"{self.column('created_at')}"
+        )
+        return {
+            item.recipe_id: item.created_at
+            for item in self.model.objects.raw(sql, [user.pk, *recipe_ids])
+        }
+
+    def quote(self, name):
+        return connection.ops.quote_name(name)
+
+    def column(self, name):
+        return self.quote(self.model._meta.get_field(name).column)
+
+    def recipes_added(self, recipe_ids):
+        popularity.add_events(self.model, recipe_ids)
+
+    def recipes_removed(self, events):
+        """events — словарь {id рецепта: время добавления}."""
+        popularity.remove_events(self.model, events)
+
+
+class BulkFavoritesView(BulkRecipeListView):
+    """Добавляем или убираем несколько рецептов из избранного."""
+
+    model = Favorite
+
+    def recipes_added(self, recipe_ids):
+        super().recipes_added(recipe_ids)
+        change_counters(Recipe, recipe_ids, "favorites_count", 1)
+
+    def recipes_removed(self, events):
+        super().recipes_removed(events)
+        change_counters(Recipe, list(events), "favorites_count", -1)
+
+
+class BulkShoppingCartView(BulkRecipeListView):
+    """Добавляем или убираем несколько рецептов из списка покупок."""
+
+    model = ShoppingCart
+
+
+@catalog_conditional(tag_catalog)
+class TagListView(AsyncAPIView, generics.ListAPIView):
     """Получаем список всех тегов."""
 
-    queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
+    async def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return self.catalog_data["list"]
+
 
-class TagDetailView(generics.RetrieveAPIView):
+@catalog_conditional(tag_catalog)
+class TagDetailView(AsyncAPIView, generics.RetrieveAPIView):
     """Получаем информацию о конкретном теге по ID."""
 
-    queryset = Tag.objects.all()
     serializer_class = TagSerializer
-    lookup_field = "id"
+
+    async def get(self, request, *args, **kwargs):
+        return self.retrieve(request, *args, **kwargs)
+
+    def get_object(self):
+        tag = self.catalog_data["by_id"].get(self.kwargs["id"])
+        if tag is None:
+            raise Http404
+        return tag
 
 
 class UserListView(APIView):
@@ -255,9 +587,12 @@ class UserListView(APIView):
     """
 
     def get(self, request):
-        users = User.objects.all()
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(
+            User.objects.all(), request, view=self)
+        serializer = UserSerializer(
+            page, many=True, context={"request": request})
+        return paginator.get_paginated_response(serializer.data)
 
 
 class UsersView(View):
@@ -279,7 +614,7 @@ class UserProfileView(APIView):
 
     def get(self, request, id):
         user = get_object_or_404(User, id=id)
-        serializer = UserSerializer(user)
+        serializer = UserSerializer(user, context={"request": request})
         return Response(serializer.data)
 
 
@@ -289,7 +624,8 @@ class CurrentUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user)
+        serializer = UserSerializer(
+            request.user, context={"request": request})
         return Response(serializer.data)
 
 
@@ -312,13 +648,11 @@ class UpdateAvatarView(APIView):
             )
 
         try:
-            format, imgstr = avatar_data.split(";base64,")
-            ext = format.split("/")[-1]
-            file_name = f"{uuid.uuid4()}.{ext}"
-
-            user.avatar.save(
-                file_name, ContentFile(base64.b64decode(imgstr)), save=True
-            )
+            image = decode_base64_image(avatar_data)
+            user.delete_avatar()
+            user.avatar.save(image.name, image, save=False)
+            user.save(update_fields=["avatar", "avatar_thumbnail"])
+            schedule_avatar_thumbnail(user)
 
             return Response(
                 {"avatar": user.avatar.url}, status=status.HTTP_200_OK)
@@ -330,8 +664,8 @@ class UpdateAvatarView(APIView):
     def delete(self, request):
         user = request.user
         if user.avatar:
-            user.avatar.delete()
-            user.save()
+            user.delete_avatar()
+            user.save(update_fields=["avatar", "avatar_thumbnail"])
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {"detail": "Аватар не установлен."},
@@ -373,20 +707,37 @@ class ChangePasswordView(APIView):
                 {"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+def recipes_prefetch(request):
+    """
+    Подгружаем рецепты авторов, ограничивая их число параметром
+    recipes_limit прямо в запросе к БД.
+    """
+    try:
+        limit = int(request.query_params["recipes_limit"])
+    except (KeyError, ValueError):
+        limit = None
+    if limit is not None and limit < 0:
+        limit = None
+    return Prefetch(
+        "recipes", queryset=Recipe.objects.latest_per_author(limit))
+
+
 class SubscriptionsView(APIView):
     """Возвращаем пользователей, на которых подписан текущий пользователь."""
 
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        subscribed_users = Subscription.objects.filter(user=user).values_list(
-            "subscribed_user", flat=True
-        )
         users = User.objects.filter(
-            id__in=subscribed_users).prefetch_related("recipes")
-        serializer = UserWithRecipesSerializer(users, many=True)
-        return Response(serializer.data)
+            subscribers__user=request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).prefetch_related(recipes_prefetch(request))
+        paginator = get_pagination(request)
+        page = paginator.paginate_queryset(users, request, view=self)
+        serializer = UserWithRecipesSerializer(
+            page, many=True, context={"request": request})
+        return paginator.get_paginated_response(serializer.data)
 
 
 class SubscribeView(APIView):
@@ -405,7 +756,11 @@ class SubscribeView(APIView):
             )
         Subscription.objects.create(
             user=request.user, subscribed_user=subscribed_user)
-        serializer = UserWithRecipesSerializer(subscribed_user)
+        subscribed_user = User.objects.annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).prefetch_related(recipes_prefetch(request)).get(id=id)
+        serializer = UserWithRecipesSerializer(
+            subscribed_user, context={"request": request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, id):
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,6 +61,14 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# wsgi или asgi, см. gunicorn.conf.py.
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+
+# Каждый поток воркера держит своё постоянное соединение с БД, так что
+# пул воркера равен GUNICORN_THREADS. В режиме ASGI соединения
+# открываются в разных потоках и постоянными быть не могут, их пулом
+# занимается PgBouncer (DB_POOLER=pgbouncer).
+DB_POOLER = os.getenv('DB_POOLER')
 
 DATABASES = {
     'default': {
@@ -68,7 +77,16 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': (
+            0 if SERVER_MODE == 'asgi'
+            else int(os.getenv('DB_CONN_MAX_AGE', 60))),
+        'CONN_HEALTH_CHECKS': True,
+        # Серверные курсоры не работают в транзакционном режиме PgBouncer.
+        'DISABLE_SERVER_SIDE_CURSORS': DB_POOLER == 'pgbouncer',
+        'OPTIONS': {
+            'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+        },
     }
 }
 
@@ -110,6 +128,82 @@ MEDIA_ROOT = BASE_DIR / 'media/'
 if not os.path.exists(MEDIA_ROOT):
     os.makedirs(MEDIA_ROOT)
 
+# Общий для воркеров кэш. Можно подключить Redis:
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache,
+# CACHE_LOCATION=redis://redis:6379/0 (нужен пакет redis).
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', '/tmp/foodgram_cache'),
+    }
+}
+if 'redis' not in CACHE_BACKEND:
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 5000)),
+    }
+
+# Время жизни закэшированных ответов для анонимных пользователей.
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+# Как часто воркер сверяет версию справочников тегов и ингредиентов.
+CATALOG_CACHE_CHECK_INTERVAL = int(
+    os.getenv('CATALOG_CACHE_CHECK_INTERVAL', 5))
+
+# Метрики запросов: порог медленного запроса для лога (0 — выключен)
+# и токен доступа к /api/metrics/ (без него метрики видят только админы).
+METRICS_SLOW_REQUEST_MS = int(os.getenv('METRICS_SLOW_REQUEST_MS', 0))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Каталог, через который воркеры gunicorn складывают метрики (пусто —
+# метрики только своего процесса), и период записи метрик воркера.
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+# Конфигурация полнотекстового поиска PostgreSQL.
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'russian')
+
+# Лента подписок: рецепты авторов, у которых подписчиков больше
+# FEED_FANOUT_LIMIT, не раскладываются по лентам, а добавляются при чтении.
+# После подписки в ленту попадают FEED_BACKFILL_SIZE последних рецептов.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 100))
+
+# Подбор рецептов по ингредиентам: минимальная доля ингредиентов рецепта,
+# которые есть у пользователя, период дообновления индекса в воркере
+# и время хранения отметок об изменениях рецептов (в секундах).
+RECIPE_MATCH_MIN_COVERAGE = float(
+    os.getenv('RECIPE_MATCH_MIN_COVERAGE', 0.5))
+RECIPE_INDEX_SYNC_INTERVAL = int(os.getenv('RECIPE_INDEX_SYNC_INTERVAL', 5))
+RECIPE_INDEX_RETENTION = int(os.getenv('RECIPE_INDEX_RETENTION', 86400))
+
+# Похожие рецепты: сколько соседей хранить для рецепта, вес тега
+# относительно ингредиента и доля рецептов, начиная с которой признак
+# слишком частый, чтобы искать по нему кандидатов.
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', 10))
+SIMILAR_RECIPES_TAG_WEIGHT = float(
+    os.getenv('SIMILAR_RECIPES_TAG_WEIGHT', 0.5))
+SIMILAR_RECIPES_MAX_DF = float(os.getenv('SIMILAR_RECIPES_MAX_DF', 0.05))
+
+# Оценки для сортировок popular и trending: добавление в избранное
+# и в список покупок вдвое теряет вес за период полураспада (в часах),
+# добавление в список покупок весит POPULARITY_CART_WEIGHT от избранного.
+POPULARITY_HALF_LIFE_HOURS = float(
+    os.getenv('POPULARITY_HALF_LIFE_HOURS', 30 * 24))
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 48))
+POPULARITY_CART_WEIGHT = float(os.getenv('POPULARITY_CART_WEIGHT', 0.5))
+
+# Короткие ссылки: длина кода, размер LRU-кэша кодов в каждом воркере
+# и период записи накопленных переходов в БД.
+SHORT_LINK_LENGTH = int(os.getenv('SHORT_LINK_LENGTH', 6))
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 10000))
+SHORT_LINK_FLUSH_INTERVAL = int(os.getenv('SHORT_LINK_FLUSH_INTERVAL', 10))
+
+# Обработка загруженных изображений в фоновых потоках.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_MAX_UPLOAD_SIZE = int(os.getenv('IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 ** 2))
+RECIPE_IMAGE_WIDTHS = (320, 640, 1280)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
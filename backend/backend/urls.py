@@ -17,11 +17,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
+from api.short_links import short_link_redirect
 from . import settings
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('r/<str:code>', short_link_redirect, name='short-link'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,33 @@
+import multiprocessing
+import os
+import shutil
+
+# SERVER_MODE=asgi запускает приложение через воркеры uvicorn,
+# в которых асинхронные view не занимают поток на время ожидания БД.
+server_mode = os.environ.get('SERVER_MODE', 'wsgi')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get(
+    'GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+if server_mode == 'asgi':
+    wsgi_app = 'backend.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'backend.wsgi:application'
+    threads = int(os.environ.get('GUNICORN_THREADS', 1))
+
+# Воркеры складывают метрики в общий каталог, который очищаем при старте,
+# чтобы не подмешивать счётчики прошлого запуска.
+metrics_dir = os.environ.setdefault('METRICS_DIR', '/tmp/foodgram-metrics')
+
+
+def on_starting(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_worker_init(worker):
+    # Индекс подбора рецептов загружаем сразу, а не в первом запросе.
+    from recipes.matching import warm_up
+    warm_up()
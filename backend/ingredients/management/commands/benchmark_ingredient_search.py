@@ -0,0 +1,50 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from ingredients.models import Ingredient
+from ingredients.search import IngredientIndex
+
+
+class Command(BaseCommand):
+    help = "Measures ingredient autocomplete latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            self.stderr.write('The ingredient table is empty.')
+            return
+        rng = random.Random(options['seed'])
+        queries = []
+        for _ in range(options['queries']):
+            name = rng.choice(names)
+            start = rng.randrange(len(name)) if rng.random() < 0.3 else 0
+            queries.append(name[start:start + rng.randint(1, 6)])
+
+        started = time.perf_counter()
+        index = IngredientIndex(Ingredient.objects.all())
+        self.stdout.write('Index built in %.1f ms for %d ingredients' % (
+            (time.perf_counter() - started) * 1000, len(names)))
+
+        self._report('index', queries, index.search)
+        self._report(
+            'database', queries,
+            lambda query: list(Ingredient.objects.filter(
+                name__istartswith=query)),
+        )
+
+    def _report(self, label, queries, search):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        percentiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(self.style.SUCCESS(
+            '%s: p50 %.3f ms, p95 %.3f ms, p99 %.3f ms' % (
+                label, percentiles[49], percentiles[94], percentiles[98])))
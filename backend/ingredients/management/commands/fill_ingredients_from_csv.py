@@ -1,29 +1,61 @@
-from django.core.management.base import BaseCommand
+import csv
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
 from ingredients.models import Ingredient
 from backend.settings import BASE_DIR
-from django.db.utils import IntegrityError
+from api.catalog import ingredient_catalog
 
 
 class Command(BaseCommand):
-    help = "Fills the table with the data from csv file"
+    help = "Fills the table with the data from csv or json file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            type=Path,
+            default=BASE_DIR / 'data/ingredients.csv',
+            help='Path to a .csv (name,unit) or .json file',
+        )
 
     def handle(self, *args, **options):
-        with open(BASE_DIR / 'data/ingredients.csv', 'r') as csv_file:
-            lines = csv_file.readlines()
-            for line in lines:
-                data = line.split(',')
-                try:
-                    ingr = Ingredient.objects.create(
-                        name=data[0].strip(),
-                        measurement_unit=data[1].strip())
-                    ingr.save()
-                except IntegrityError:
-                    continue
-                except Exception as e:
-                    raise e
-
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        'Successfully wrote "%s" with unit "%s"' % (
-                            data[0], data[1]))
-                )
+        path = options['path']
+        if path.suffix == '.json':
+            rows = self._read_json(path)
+        elif path.suffix == '.csv':
+            rows = self._read_csv(path)
+        else:
+            raise CommandError('Only .csv and .json files are supported.')
+
+        ingredients = {}
+        for name, measurement_unit in rows:
+            name, measurement_unit = name.strip(), measurement_unit.strip()
+            if name:
+                ingredients.setdefault(name, measurement_unit)
+        existing = set(Ingredient.objects.filter(
+            name__in=ingredients).values_list('name', flat=True))
+        new = [
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in ingredients.items()
+            if name not in existing
+        ]
+        Ingredient.objects.bulk_create(
+            new, batch_size=1000, ignore_conflicts=True)
+        if new:
+            ingredient_catalog.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Inserted %d ingredients, skipped %d existing' % (
+                len(new), len(existing))))
+
+    def _read_csv(self, path):
+        with open(path, 'r', encoding='utf-8', newline='') as csv_file:
+            for row in csv.reader(csv_file):
+                if len(row) >= 2:
+                    yield row[0], row[1]
+
+    def _read_json(self, path):
+        with open(path, 'r', encoding='utf-8') as json_file:
+            for item in json.load(json_file):
+                yield item['name'], item['measurement_unit']
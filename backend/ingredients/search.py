@@ -0,0 +1,70 @@
+from bisect import bisect_left
+
+
+def normalize(value):
+    """Приводим строку к виду для поиска без учёта регистра и ё/е."""
+    return value.casefold().replace('ё', 'е').strip()
+
+
+def trigrams(value):
+    """Множество триграмм строки."""
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+    Сначала отдаём совпадения по началу названия через бинарный поиск
+    по отсортированным ключам, затем совпадения по подстроке, кандидаты
+    для которых берём из триграммного индекса.
+    """
+
+    def __init__(self, ingredients):
+        self.ingredients = list(ingredients)
+        self.by_id = {item.id: item for item in self.ingredients}
+        entries = sorted(
+            (normalize(ingredient.name), position)
+            for position, ingredient in enumerate(self.ingredients)
+        )
+        self.keys = [key for key, _ in entries]
+        self.positions = [position for _, position in entries]
+        self.names = [normalize(item.name) for item in self.ingredients]
+        self.trigrams = {}
+        for position, name in enumerate(self.names):
+            for trigram in trigrams(name):
+                self.trigrams.setdefault(trigram, set()).add(position)
+
+    def search(self, query):
+        """Ищем ингредиенты: сначала по началу названия, затем по вхождению."""
+        query = normalize(query)
+        if not query:
+            return list(self.ingredients)
+
+        start = bisect_left(self.keys, query)
+        prefix = []
+        for index in range(start, len(self.keys)):
+            if not self.keys[index].startswith(query):
+                break
+            prefix.append(self.positions[index])
+
+        found = set(prefix)
+        substring = [
+            (self.names[position].find(query), self.names[position], position)
+            for position in self._candidates(query)
+            if position not in found and query in self.names[position]
+        ]
+        substring.sort()
+        return [self.ingredients[position] for position in prefix] + [
+            self.ingredients[position] for _, _, position in substring
+        ]
+
+    def _candidates(self, query):
+        """Позиции названий, содержащих все триграммы запроса."""
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return range(len(self.names))
+        postings = sorted(
+            (self.trigrams.get(trigram, set()) for trigram in query_trigrams),
+            key=len,
+        )
+        return set.intersection(*postings)
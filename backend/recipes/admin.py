@@ -1,5 +1,11 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Recipe, RecipeIngredient, ShoppingCart, Favorite
+from django.contrib.postgres.search import SearchQuery
+from django.db import connection
+from django.db.models import Q
+from .models import (
+    Favorite, Recipe, RecipeIngredient, ShoppingCart, ShortLink
+)
 
 
 class RecipeIngredientInline(admin.TabularInline):
@@ -9,13 +15,25 @@ class RecipeIngredientInline(admin.TabularInline):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     """Рецепты."""
-    list_display = ('name', 'author', 'cooking_time')
+    list_display = ('name', 'author', 'cooking_time', 'favorites_count')
     search_fields = ('name', 'author__username')
     list_filter = ('tags', 'author')
     ordering = ('-id',)
     inlines = RecipeIngredientInline,
     filter_horizontal = ('tags', 'ingredients')
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищем рецепты по поисковому вектору и автора по логину."""
+        if not search_term or connection.vendor != 'postgresql':
+            return super().get_search_results(
+                request, queryset, search_term)
+        query = SearchQuery(
+            search_term, config=settings.SEARCH_CONFIG,
+            search_type='websearch')
+        return queryset.filter(
+            Q(search_vector=query) | Q(author__username=search_term)
+        ), False
+
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
@@ -36,3 +54,11 @@ class FavoriteAdmin(admin.ModelAdmin):
     """Избранные рецепты."""
     list_display = ('user', 'recipe', 'created_at')
     list_filter = ('user', 'created_at')
+
+
+@admin.register(ShortLink)
+class ShortLinkAdmin(admin.ModelAdmin):
+    """Короткие ссылки."""
+    list_display = ('code', 'recipe', 'hits')
+    search_fields = ('code', 'recipe__name')
+    readonly_fields = ('hits',)
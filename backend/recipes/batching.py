@@ -0,0 +1,32 @@
+from django.db import transaction
+
+
+def on_commit_batched(action, *items):
+    """
+    Вызываем action(items) один раз после фиксации транзакции со всеми
+    элементами, переданными с тем же action за время транзакции. Сигналы
+    приходят по одному на строку, например на каждую строку ингредиентов
+    рецепта, а пересчитать рецепт или сбросить кэш достаточно один раз.
+    Вне транзакции action вызывается сразу.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        action(set(items))
+        return
+    batches = connection.__dict__.setdefault('on_commit_batches', {})
+    callback, pending = batches.get(action, (None, None))
+    # После отката транзакции или точки сохранения обработчик пропадает
+    # из очереди соединения, и собирать элементы нужно заново.
+    if callback is None or not any(
+        func is callback for _, func, _ in connection.run_on_commit
+    ):
+        pending = set()
+
+        def callback():
+            if batches.get(action, (None,))[0] is callback:
+                del batches[action]
+            action(pending)
+
+        batches[action] = (callback, pending)
+        transaction.on_commit(callback)
+    pending.update(items)
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.matching import CHANGE_LAG
+from recipes.models import Recipe, RecipeIngredientsChange, SimilarRecipe
+from recipes.similarity import (
+    SimilarityIndex, last_run, load_features, save_neighbors
+)
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Computes similar recipes from ingredients and tags"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--changed', action='store_true',
+            help='Only recompute recipes changed since the last run')
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        index = SimilarityIndex(*load_features())
+        count = settings.SIMILAR_RECIPES_COUNT
+
+        changed = self.get_changed() if options['changed'] else None
+        if changed is None:
+            recipe_ids = Recipe.objects.order_by('id').values_list(
+                'id', flat=True)
+            updated = self.compute(index, list(recipe_ids), count, started)
+        else:
+            # Соседи изменённого рецепта считаются заново, а вместе с ними
+            # и списки рецептов, где он был или теперь может оказаться.
+            referrers = set(SimilarRecipe.objects.filter(
+                similar_id__in=changed).values_list('recipe_id', flat=True))
+            neighbors = {}
+            updated = self.compute(
+                index, sorted(changed), count, started, neighbors)
+            affected = referrers.union(*(
+                (similar_id for _, similar_id in items)
+                for items in neighbors.values()
+            )) - changed
+            updated += self.compute(index, sorted(affected), count, started)
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(
+                'Computed similar recipes for %d recipes' % updated))
+
+    def get_changed(self):
+        """
+        Возвращаем ID рецептов, изменённых после прошлого расчёта, или None,
+        если соседей ещё не считали. Отметки об изменениях не удаляются,
+        пока этот расчёт их не учтёт (см. RecipeIngredientIndex.sync).
+        """
+        previous_run = last_run()
+        if previous_run is None:
+            return None
+        return set(RecipeIngredientsChange.objects.filter(
+            created_at__gte=previous_run - CHANGE_LAG
+        ).values_list('recipe_id', flat=True))
+
+    def compute(self, index, recipe_ids, count, computed_at, results=None):
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            neighbors = index.neighbors(
+                recipe_ids[start:start + BATCH_SIZE], count)
+            save_neighbors(neighbors, computed_at)
+            if results is not None:
+                results.update(neighbors)
+        return len(recipe_ids)
@@ -0,0 +1,129 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Exists, OuterRef, Sum
+
+from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from recipes.synthetic import delete_dataset, generate_dataset
+from recipes.timeline import feed as followed_feed
+from tags.models import Tag
+from users.models import User
+
+# Маленькие справочники, для которых полный просмотр таблицы нормален.
+SEQ_SCAN_ALLOWED = {'tags_tag', 'ingredients_ingredient'}
+
+PAGE_SIZE = 10
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN ANALYZE for the hot API queries and fails when a plan "
+        "falls back to a sequential scan or an on-disk sort"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed-users', type=int, default=0,
+            help='Generate this many synthetic users before checking')
+        parser.add_argument(
+            '--seed-recipes', type=int, default=0,
+            help='Generate this many synthetic recipes before checking')
+        parser.add_argument(
+            '--flush', action='store_true',
+            help='Delete the synthetic dataset after checking')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans are checked on PostgreSQL only.')
+        if options['seed_users'] or options['seed_recipes']:
+            generate_dataset(
+                users=options['seed_users'],
+                recipes=options['seed_recipes'],
+            )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        failures = []
+        for name, queryset in self.get_queries():
+            plan = self.explain(queryset)
+            problems = self.find_problems(plan)
+            if problems:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(
+                    '%s: %s\n%s' % (name, ', '.join(problems), plan)))
+            else:
+                self.stdout.write(self.style.SUCCESS('%s: ok' % name))
+
+        if options['flush']:
+            delete_dataset()
+        if failures:
+            raise CommandError(
+                'Query plan regressions: %s' % ', '.join(failures))
+
+    def explain(self, queryset):
+        """
+        План выполнения запроса. QuerySet.explain() не годится: для запросов
+        с фильтром по оконной функции Django 4.2 добавляет EXPLAIN
+        и во вложенный подзапрос.
+        """
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def find_problems(self, plan):
+        problems = [
+            f'sequential scan on {table}'
+            for table in re.findall(r'Seq Scan on (\w+)', plan)
+            if table not in SEQ_SCAN_ALLOWED
+        ]
+        if 'Sort Method: external' in plan:
+            problems.append('on-disk sort')
+        return problems
+
+    def get_queries(self):
+        """Запросы, которые выполняют самые нагруженные эндпоинты."""
+        user = User.objects.order_by('-subscribers_count').first()
+        fan = Favorite.objects.values_list('user', flat=True).first()
+        fan = User.objects.get(pk=fan) if fan else user
+        tag = Tag.objects.first()
+        if user is None or tag is None:
+            raise CommandError(
+                'The database is empty, use --seed-users/--seed-recipes.')
+
+        feed = Recipe.objects.with_related(fan)
+        return [
+            ('recipe feed', feed.order_by('name', 'id')[:PAGE_SIZE]),
+            ('recipe feed by author', feed.filter(
+                author=user).order_by('name', 'id')[:PAGE_SIZE]),
+            ('recipe feed by tag', feed.filter(
+                tags__slug=tag.slug).order_by('name', 'id')[:PAGE_SIZE]),
+            # ?ordering=popular и ?ordering=trending.
+            ('recipe feed by popularity', feed.order_by(
+                '-popularity', '-id')[:PAGE_SIZE]),
+            ('recipe feed by trending', feed.order_by(
+                '-trending', '-id')[:PAGE_SIZE]),
+            ('recipe search', feed.search('суп с курицей')[:PAGE_SIZE]),
+            ('favorited recipes', feed.filter(Exists(Favorite.objects.filter(
+                user=fan, recipe=OuterRef('pk')))).order_by(
+                    'name', 'id')[:PAGE_SIZE]),
+            ('recipes in shopping cart', feed.filter(Exists(
+                ShoppingCart.objects.filter(
+                    user=fan, recipe=OuterRef('pk')))).order_by(
+                        'name', 'id')[:PAGE_SIZE]),
+            ('user favorites', Favorite.objects.filter(
+                user=fan)[:PAGE_SIZE]),
+            ('shopping list', RecipeIngredient.objects.filter(
+                recipe__in_shopping_cart__user=fan
+            ).values(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ).annotate(total=Sum('amount')).order_by('ingredient__name')),
+            ('followed authors feed', followed_feed(fan).with_related(
+                fan).order_by('-id')[:PAGE_SIZE]),
+            ('subscriptions', User.objects.filter(
+                subscribers__user=fan)[:PAGE_SIZE]),
+            ('author recipes', Recipe.objects.latest_per_author(3).filter(
+                author__in=User.objects.filter(
+                    subscribers__user=fan).values('id')[:PAGE_SIZE])),
+        ]
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from recipes.models import Recipe, TimelineEntry
+from users.models import Subscription, User
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Fills followed-authors feeds from existing subscriptions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Only fill feeds of users that have no feed entries yet')
+
+    def handle(self, *args, **options):
+        subscriptions = Subscription.objects.all()
+        if options['missing']:
+            subscriptions = subscriptions.exclude(Exists(
+                TimelineEntry.objects.filter(user=OuterRef('user'))))
+        authors = User.objects.filter(
+            Exists(subscriptions.filter(subscribed_user=OuterRef('pk'))),
+            subscribers_count__lte=settings.FEED_FANOUT_LIMIT,
+        ).values_list('id', flat=True)
+
+        filled = 0
+        for author_id in authors.iterator():
+            recipe_ids = list(Recipe.objects.filter(
+                author_id=author_id
+            ).order_by('-id').values_list(
+                'id', flat=True)[:settings.FEED_BACKFILL_SIZE])
+            if not recipe_ids:
+                continue
+            follower_ids = subscriptions.filter(
+                subscribed_user_id=author_id
+            ).values_list('user_id', flat=True)
+            TimelineEntry.objects.bulk_create(
+                [
+                    TimelineEntry(
+                        user_id=user_id,
+                        recipe_id=recipe_id,
+                        author_id=author_id,
+                    )
+                    for user_id in follower_ids
+                    for recipe_id in recipe_ids
+                ],
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+            filled += 1
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(
+                'Filled feeds with recipes of %d authors' % filled))
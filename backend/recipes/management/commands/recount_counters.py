@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+from users.models import Subscription, User
+
+
+def count_subquery(model, field):
+    """Подзапрос с количеством строк model, ссылающихся на внешнюю строку."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = "Recalculates denormalized counters of users and recipes"
+
+    counters = (
+        (User, 'recipes_count', Recipe, 'author'),
+        (User, 'subscribers_count', Subscription, 'subscribed_user'),
+        (Recipe, 'favorites_count', Favorite, 'recipe'),
+    )
+
+    def handle(self, *args, **options):
+        for model, counter, related_model, field in self.counters:
+            actual = count_subquery(related_model, field)
+            fixed = model.objects.exclude(**{counter: actual}).update(
+                **{counter: actual})
+            if options['verbosity']:
+                self.stdout.write(self.style.SUCCESS(
+                    'Fixed %s.%s in %d rows' % (
+                        model.__name__, counter, fixed)))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipes.popularity import recompute
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes decayed popularity and trending scores of recipes, "
+        "meant to be run periodically"
+    )
+
+    def handle(self, *args, **options):
+        updated = recompute()
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(
+                'Updated popularity scores of %d recipes' % updated))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Rebuilds full-text search vectors of recipes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Only fill recipes that have no search vector yet')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Search vectors are built on PostgreSQL only.')
+        recipes = Recipe.objects.all()
+        if options['missing']:
+            recipes = recipes.filter(search_vector__isnull=True)
+        updated = recipes.update_search_vector()
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(
+                'Updated search vectors of %d recipes' % updated))
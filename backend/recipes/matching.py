@@ -0,0 +1,277 @@
+from array import array
+from collections import defaultdict
+from datetime import timedelta
+from threading import Lock, Thread
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from .batching import on_commit_batched
+from .models import RecipeIngredient, RecipeIngredientsChange, SimilarRecipe
+
+# Тип элементов списков рецептов: беззнаковые 32-битные числа.
+TYPECODE = 'I'
+
+# Допуск при сравнении покрытия с порогом, чтобы 0.3 * 10 не превращалось
+# в 3.0000000000000004 совпавших ингредиента.
+EPSILON = 1e-9
+
+# Отметки об изменениях перечитываем с запасом: их время берётся
+# с часов разных серверов, а вставки завершаются не по порядку.
+CHANGE_LAG = timedelta(seconds=30)
+
+# Как часто воркер удаляет устаревшие отметки об изменениях.
+PRUNE_INTERVAL = timedelta(hours=1)
+
+# Сколько рецептов перечитываем одним запросом.
+CHUNK_SIZE = 1000
+
+
+class MatchResults:
+    """
+    Результаты подбора в массивах numpy. Paginator берёт у них длину
+    и срез страницы, поэтому полностью упорядочиваем только рецепты
+    до конца запрошенной страницы.
+    """
+
+    def __init__(self, coverage, counts, recipe_ids):
+        self.coverage = coverage
+        self.counts = counts
+        self.recipe_ids = recipe_ids
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError('MatchResults supports only slices.')
+        start, stop, _ = key.indices(len(self))
+        return self.top(stop)[start:]
+
+    def top(self, count):
+        """Кортежи (покрытие, число совпавших, id) count лучших рецептов."""
+        coverage, counts, recipe_ids = (
+            self.coverage, self.counts, self.recipe_ids)
+        if count <= 0:
+            return []
+        if count < len(recipe_ids):
+            # Отбрасываем рецепты с покрытием ниже count-го за линейное
+            # время; равные ему остаются и упорядочиваются ниже.
+            threshold = np.partition(coverage, len(coverage) - count)[
+                len(coverage) - count]
+            keep = coverage >= threshold
+            coverage, counts, recipe_ids = (
+                coverage[keep], counts[keep], recipe_ids[keep])
+        order = np.lexsort((recipe_ids, counts, coverage))[::-1][:count]
+        return list(zip(
+            coverage[order].tolist(),
+            counts[order].tolist(),
+            recipe_ids[order].tolist(),
+        ))
+
+
+class RecipeIngredientIndex:
+    """
+    Обратный индекс «ингредиент → рецепты» в памяти процесса.
+    Списки рецептов хранятся компактными массивами целых чисел, разбитыми
+    по числу ингредиентов рецепта, поэтому подбор — это подсчёт вхождений
+    по нескольким массивам в numpy без группировки всей таблицы
+    ингредиентов рецептов в БД, а рецепты, которые слишком длинные, чтобы
+    набрать min_coverage, не просматриваются вовсе.
+    Индекс загружается при старте воркера (см. warm_up), а затем раз
+    в RECIPE_INDEX_SYNC_INTERVAL секунд дообновляется по отметкам
+    RecipeIngredientsChange, которые пишутся при изменении рецептов.
+    """
+
+    def __init__(self):
+        self.postings = None
+        self.ingredients = {}
+        self.synced_at = None
+        self.checked_at = None
+        self.pruned_at = None
+        self.lock = Lock()
+
+    def match(self, ingredient_ids, min_coverage):
+        """
+        Подбираем рецепты по имеющимся ингредиентам. Покрытие — доля
+        ингредиентов рецепта, которые есть у пользователя. Возвращаем
+        MatchResults с рецептами, покрытие которых не ниже min_coverage;
+        срез отдаёт кортежи (покрытие, число совпавших ингредиентов,
+        id рецепта), лучшие первыми.
+        """
+        self.sync()
+        postings = self.postings
+        buckets = [
+            postings[ingredient_id] for ingredient_id in set(ingredient_ids)
+            if ingredient_id in postings
+        ]
+        # В рецепте длиннее этого даже все ингредиенты пользователя
+        # не дадут нужного покрытия.
+        max_length = len(buckets) / min_coverage + EPSILON
+        arrays = []
+        lengths = []
+        for bucket in buckets:
+            for length, recipe_ids in bucket.items():
+                if length <= max_length and recipe_ids:
+                    arrays.append(np.frombuffer(recipe_ids, dtype=TYPECODE))
+                    lengths.append(length)
+        if not arrays:
+            empty = np.empty(0, dtype=TYPECODE)
+            return MatchResults(np.empty(0), empty, empty)
+        recipe_ids = np.concatenate(arrays)
+        counts = np.bincount(recipe_ids)
+        totals = np.zeros(len(counts), dtype=np.uint16)
+        totals[recipe_ids] = np.repeat(
+            np.array(lengths, dtype=np.uint16), [len(item) for item in arrays])
+        recipe_ids = np.flatnonzero(counts)
+        counts = counts[recipe_ids]
+        coverage = counts / totals[recipe_ids]
+        keep = coverage >= min_coverage - EPSILON
+        return MatchResults(coverage[keep], counts[keep], recipe_ids[keep])
+
+    def sync(self):
+        """Загружаем индекс или применяем изменения рецептов."""
+        now = timezone.now()
+        interval = timedelta(seconds=settings.RECIPE_INDEX_SYNC_INTERVAL)
+        if self.postings is not None and now - self.checked_at < interval:
+            return
+        with self.lock:
+            if self.postings is not None and now - self.checked_at < interval:
+                return
+            retention = timedelta(seconds=settings.RECIPE_INDEX_RETENTION)
+            if (self.postings is None
+                    or now - self.synced_at > retention - CHANGE_LAG):
+                # Отметки могли удалить, поэтому перечитываем всё.
+                self.load(now)
+            else:
+                self.apply_changes(now)
+            self.checked_at = now
+            if now - self.pruned_at >= PRUNE_INTERVAL:
+                self.prune(now - retention)
+                self.pruned_at = now
+
+    def prune(self, before):
+        """
+        Удаляем устаревшие отметки об изменениях. Отметки, которые ещё
+        не учёл расчёт похожих рецептов, оставляем ему.
+        """
+        similar_run = SimilarRecipe.objects.aggregate(
+            last_run=Max('computed_at'))['last_run']
+        if similar_run is not None:
+            before = min(before, similar_run - CHANGE_LAG)
+        RecipeIngredientsChange.objects.filter(created_at__lt=before).delete()
+
+    def load(self, now):
+        rows = RecipeIngredient.objects.order_by().values_list(
+            'recipe_id', 'ingredient_id')
+        self.build(rows.iterator(chunk_size=10000))
+        self.synced_at = now
+        if self.pruned_at is None:
+            self.pruned_at = now - PRUNE_INTERVAL
+
+    def build(self, rows):
+        """Строим индекс по парам (id рецепта, id ингредиента)."""
+        by_recipe = defaultdict(set)
+        for recipe_id, ingredient_id in rows:
+            by_recipe[recipe_id].add(ingredient_id)
+        postings = defaultdict(dict)
+        for recipe_id, ingredient_ids in by_recipe.items():
+            length = len(ingredient_ids)
+            for ingredient_id in ingredient_ids:
+                bucket = postings[ingredient_id]
+                if length not in bucket:
+                    bucket[length] = array(TYPECODE)
+                bucket[length].append(recipe_id)
+        self.postings = dict(postings)
+        self.ingredients = {
+            recipe_id: tuple(ingredient_ids)
+            for recipe_id, ingredient_ids in by_recipe.items()
+        }
+
+    def apply_changes(self, now):
+        recipe_ids = list(set(RecipeIngredientsChange.objects.filter(
+            created_at__gte=self.synced_at - CHANGE_LAG
+        ).values_list('recipe_id', flat=True)))
+        for start in range(0, len(recipe_ids), CHUNK_SIZE):
+            self.update(recipe_ids[start:start + CHUNK_SIZE])
+        self.synced_at = now
+
+    def update(self, recipe_ids):
+        """
+        Перечитываем состав рецептов и правим их списки. Массивы и словари
+        списков не меняем на месте, а заменяем копиями, чтобы не мешать
+        параллельному match.
+        """
+        current = defaultdict(set)
+        rows = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in rows:
+            current[recipe_id].add(ingredient_id)
+        for recipe_id in recipe_ids:
+            old = set(self.ingredients.get(recipe_id, ()))
+            new = current.get(recipe_id, set())
+            if old == new:
+                continue
+            # Рецепт с другим числом ингредиентов переезжает в другие
+            # списки, поэтому убираем его отовсюду и добавляем заново.
+            for ingredient_id in old:
+                self.change_posting(ingredient_id, len(old), recipe_id, False)
+            for ingredient_id in new:
+                self.change_posting(ingredient_id, len(new), recipe_id, True)
+            if new:
+                self.ingredients[recipe_id] = tuple(new)
+            else:
+                self.ingredients.pop(recipe_id, None)
+
+    def change_posting(self, ingredient_id, length, recipe_id, add):
+        bucket = dict(self.postings.get(ingredient_id, {}))
+        posting = bucket.get(length, ())
+        if add:
+            posting = array(TYPECODE, posting)
+            posting.append(recipe_id)
+        else:
+            posting = array(
+                TYPECODE, (item for item in posting if item != recipe_id))
+        if posting:
+            bucket[length] = posting
+        else:
+            bucket.pop(length, None)
+        self.postings[ingredient_id] = bucket
+
+
+recipe_index = RecipeIngredientIndex()
+
+
+def mark_changed(recipe_id):
+    """
+    Отмечаем изменение состава рецепта после фиксации транзакции, чтобы
+    воркеры не прочитали отметку раньше самих данных. Индексу важен сам
+    факт изменения, поэтому за транзакцию пишем одну отметку на рецепт.
+    """
+    on_commit_batched(create_marks, recipe_id)
+
+
+def create_marks(recipe_ids):
+    RecipeIngredientsChange.objects.bulk_create(
+        RecipeIngredientsChange(recipe_id=recipe_id)
+        for recipe_id in recipe_ids
+    )
+
+
+def warm_up():
+    """
+    Загружаем индекс в фоновом потоке при старте воркера: воркер сразу
+    принимает запросы, а первый подбор не ждёт полной загрузки индекса
+    дольше, чем она уже идёт.
+    """
+    def load():
+        try:
+            recipe_index.sync()
+        finally:
+            connection.close()
+
+    Thread(target=load, name='recipe-index', daemon=True).start()
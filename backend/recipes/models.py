@@ -1,7 +1,25 @@
+from io import BytesIO
+from pathlib import Path
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, SearchVectorField
+)
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, models
+from django.db.models import (
+    BooleanField, Exists, F, OuterRef, Prefetch, Subquery, TextField, Value,
+    Window
+)
+from django.db.models.functions import Coalesce, RowNumber
+from django.dispatch import Signal
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
+from PIL import Image
 
 from ingredients.models import Ingredient
 from tags.models import Tag
@@ -15,6 +33,100 @@ COOKING_TIME_MAX = 32000
 AMOUNT_MIN = 1
 AMOUNT_MAX = 32000
 
+# Форматы, в которые перекодируются изображения рецептов.
+IMAGE_VARIANT_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+# Рецепты изменены через QuerySet.update() в обход post_save. Аргументы:
+# recipe_ids — ID изменённых рецептов (None — любых), fields — поля.
+recipes_updated = Signal()
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов для рецептов."""
+
+    def with_related(self, user=None):
+        """
+        Подгружаем автора, теги и ингредиенты фиксированным числом запросов
+        и аннотируем флаги избранного и списка покупок для текущего
+        пользователя.
+        """
+        if user is not None and user.is_authenticated:
+            is_favorited = Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            is_in_shopping_cart = Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        else:
+            is_favorited = is_in_shopping_cart = Value(
+                False, output_field=BooleanField())
+        return self.defer('search_vector').annotate(
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart,
+        ).prefetch_related(
+            'author',
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'),
+            ),
+        )
+
+    def search(self, text):
+        """
+        Полнотекстовый поиск по поисковому вектору рецепта. Результаты
+        упорядочены по релевантности, при равной релевантности по id.
+        """
+        query = SearchQuery(
+            text, config=settings.SEARCH_CONFIG, search_type='websearch')
+        return self.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query),
+        ).order_by('-search_rank', '-id')
+
+    def update_search_vector(self):
+        """
+        Пересчитываем поисковый вектор: название важнее ингредиентов,
+        ингредиенты важнее описания. Вектор строится только в PostgreSQL.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        config = settings.SEARCH_CONFIG
+        ingredient_names = RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector(
+                Coalesce(
+                    Subquery(ingredient_names),
+                    Value(''),
+                    output_field=TextField(),
+                ),
+                weight='B',
+                config=config,
+            )
+            + SearchVector('text', weight='C', config=config)
+        ))
+
+    def latest_per_author(self, limit=None):
+        """
+        Оставляем не больше limit последних рецептов каждого автора.
+        Отбор выполняется в БД оконной функцией ROW_NUMBER().
+        """
+        queryset = self.only(
+            'id', 'name', 'image', 'cooking_time', 'author_id'
+        ).order_by('-id')
+        if limit is None:
+            return queryset
+        return queryset.annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=F('id').desc(),
+            )
+        ).filter(row_number__lte=limit)
+
 
 class Recipe(models.Model):
     """Модель для хранения информации о рецептах."""
@@ -26,6 +138,12 @@ class Recipe(models.Model):
         verbose_name='Автор'
     )
     image = models.ImageField('Изображение', upload_to='recipes/')
+    image_variants = models.JSONField(
+        'Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField('Описание')
     cooking_time = models.PositiveIntegerField(
         'Время приготовления (мин)',
@@ -56,14 +174,135 @@ class Recipe(models.Model):
         verbose_name='Ингредиенты',
     )
 
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False)
+    popularity = models.FloatField(
+        'Популярность', default=0, editable=False)
+    trending = models.FloatField(
+        'Популярность за последние дни', default=0, editable=False)
+    search_vector = SearchVectorField(
+        'Поисковый вектор', null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['name']
+        indexes = [
+            # Сортировка ленты по умолчанию и ключ пагинации по курсору.
+            models.Index(fields=['name', 'id'], name='recipe_name_id_idx'),
+            models.Index(
+                fields=['author', 'name', 'id'],
+                name='recipe_author_name_idx',
+            ),
+            # Последние рецепты автора: лента подписок и recipes_limit.
+            models.Index(
+                fields=['author', '-id'], name='recipe_author_id_idx'),
+            models.Index(
+                fields=['favorites_count', 'id'],
+                name='recipe_favorites_idx',
+            ),
+            models.Index(
+                fields=['popularity', 'id'], name='recipe_popularity_idx'),
+            models.Index(
+                fields=['trending', 'id'], name='recipe_trending_idx'),
+            models.Index(
+                fields=['cooking_time', 'id'],
+                name='recipe_cooking_time_idx',
+            ),
+            GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def make_image_variants(self):
+        """
+        Создаём копии изображения нескольких ширин в форматах WebP и JPEG.
+        Прежние копии не удаляем, а возвращаем их имена: удалить их можно
+        только после того, как строка рецепта сошлётся на новые.
+        """
+        stale = [
+            name
+            for names in self.image_variants.values()
+            for name in names.values()
+        ]
+        variants = {}
+        stem = Path(self.image.name).stem
+        with self.image.open('rb'), Image.open(self.image) as image:
+            image = image.convert('RGB')
+            for width in settings.RECIPE_IMAGE_WIDTHS:
+                resized = image.copy()
+                resized.thumbnail((width, width * image.height))
+                variants[str(width)] = {}
+                for ext, image_format in IMAGE_VARIANT_FORMATS.items():
+                    buffer = BytesIO()
+                    resized.save(buffer, image_format, quality=80)
+                    variants[str(width)][ext] = default_storage.save(
+                        f'recipes/variants/{stem}_{width}.{ext}',
+                        ContentFile(buffer.getvalue()),
+                    )
+        self.image_variants = variants
+        return stale
+
+
+class ShortLink(models.Model):
+    """Короткая ссылка на рецепт."""
+    code = models.CharField('Код', max_length=16, unique=True)
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='short_link',
+        verbose_name='Рецепт',
+    )
+    hits = models.PositiveBigIntegerField(
+        'Переходы', default=0, editable=False)
+
+    class Meta:
+        verbose_name = 'Короткая ссылка'
+        verbose_name_plural = 'Короткие ссылки'
+
+    def __str__(self):
+        return self.code
+
+
+class SimilarRecipe(models.Model):
+    """
+    Похожий рецепт. Соседей рецепта заранее рассчитывает команда
+    build_similar_recipes по ингредиентам и тегам.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField('Сходство')
+    computed_at = models.DateTimeField('Дата расчёта')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'], name='unique_similar_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'], name='similar_recipe_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.similar_id} похож на {self.recipe_id}'
+
 
 class RecipeIngredient(models.Model):
     """Модель для указания количества ингредиентов в рецепте."""
@@ -102,6 +341,24 @@ class RecipeIngredient(models.Model):
         return f'{self.ingredient.name} в {self.recipe.name}'
 
 
+class RecipeIngredientsChange(models.Model):
+    """
+    Отметка об изменении состава рецепта. По этим отметкам воркеры
+    дообновляют индекс подбора рецептов по ингредиентам, не перечитывая
+    его целиком. Ссылки на рецепт нет, чтобы отметка пережила удаление.
+    """
+    recipe_id = models.PositiveBigIntegerField('ID рецепта')
+    created_at = models.DateTimeField(
+        'Дата изменения', auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Изменение состава рецепта'
+        verbose_name_plural = 'Изменения состава рецептов'
+
+    def __str__(self):
+        return f'{self.recipe_id} изменён {self.created_at}'
+
+
 class ShoppingCart(models.Model):
     """Модель для списка покупок пользователя. """
     user = models.ForeignKey(
@@ -116,6 +373,10 @@ class ShoppingCart(models.Model):
         related_name='in_shopping_cart',
         verbose_name='Рецепт',
     )
+    created_at = models.DateTimeField(
+        'Дата добавления',
+        default=timezone.now,
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -158,7 +419,55 @@ class Favorite(models.Model):
                 fields=['user', 'recipe'], name='unique_favorite'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at'],
+                name='favorite_user_created_idx',
+            ),
+        ]
         ordering = ['-created_at']
 
     def __str__(self):
         return f'{self.user.username} добавил в избранное {self.recipe.name}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя. Записи создаются при публикации
+    рецепта для каждого подписчика автора, поэтому лента читается одним
+    проходом по индексу (user, recipe).
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} в ленте {self.user_id}'
@@ -0,0 +1,145 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import (
+    Case, Exists, F, FloatField, Func, Min, OuterRef, Q, Subquery, Sum,
+    Value, When
+)
+from django.db.models.functions import Coalesce, Greatest, Power
+
+from .models import Favorite, Recipe, ShoppingCart, recipes_updated
+
+MIN_EXPONENT = -1000.0
+
+
+class Epoch(Func):
+    """Момент времени в секундах от начала эпохи Unix."""
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)'
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='(julianday(%(expressions)s) - 2440587.5) * 86400.0',
+            **extra_context,
+        )
+
+
+def half_lives():
+    """Поля оценок рецепта и периоды полураспада их событий в секундах."""
+    return {
+        'popularity': settings.POPULARITY_HALF_LIFE_HOURS * 3600,
+        'trending': settings.TRENDING_HALF_LIFE_HOURS * 3600,
+    }
+
+
+def get_weight(model):
+    """Вес события: добавление в избранное или в список покупок."""
+    if model is ShoppingCart:
+        return settings.POPULARITY_CART_WEIGHT
+    return 1.0
+
+
+def decayed_sum(model, half_life, now):
+    """
+    Подзапрос с суммой весов событий рецепта, каждый из которых
+    вдвое теряет вес за half_life секунд.
+    """
+    # Показатель ограничен снизу: такой вес уже неотличим от нуля,
+    # а PostgreSQL на меньших степенях падает с ошибкой underflow.
+    exponent = Greatest(
+        (Epoch('created_at') - Value(now)) / Value(half_life),
+        Value(MIN_EXPONENT),
+    )
+    decay = Power(Value(2.0), exponent)
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef('pk'))
+            .order_by()
+            .values('recipe')
+            .annotate(total=Sum(decay))
+            .values('total'),
+            output_field=FloatField(),
+        ),
+        Value(0.0),
+    ) * Value(get_weight(model))
+
+
+def recompute():
+    """
+    Пересчитываем оценки рецептов одним UPDATE. Трогаем только рецепты
+    с событиями или ненулевой оценкой, остальные и так на нуле.
+    """
+    now = time.time()
+    scores = {
+        field: decayed_sum(Favorite, half_life, now)
+        + decayed_sum(ShoppingCart, half_life, now)
+        for field, half_life in half_lives().items()
+    }
+    updated = Recipe.objects.filter(
+        Q(popularity__gt=0)
+        | Q(trending__gt=0)
+        | Exists(Favorite.objects.filter(recipe=OuterRef('pk')))
+        | Exists(ShoppingCart.objects.filter(recipe=OuterRef('pk')))
+    ).update(**scores)
+    recipes_updated.send(
+        sender=Recipe, recipe_ids=None, fields=list(scores))
+    return updated
+
+
+def add_events(model, recipe_ids):
+    """
+    Учитываем новые события сразу: между пересчётами новое событие
+    весит полностью, а затухание старых догонит следующий пересчёт.
+    """
+    weight = get_weight(model)
+    fields = list(half_lives())
+    Recipe.objects.filter(pk__in=recipe_ids).update(**{
+        field: F(field) + weight for field in fields})
+    recipes_updated.send(sender=Recipe, recipe_ids=recipe_ids, fields=fields)
+
+
+def remove_events(model, events):
+    """
+    Вычитаем текущий вес удалённых событий. events — словарь
+    {id рецепта: время события}, оценки не опускаются ниже нуля.
+    """
+    if not events:
+        return
+    weight = get_weight(model)
+    now = time.time()
+    updates = {}
+    for field, half_life in half_lives().items():
+        delta = Case(
+            *(
+                When(pk=recipe_id, then=Value(
+                    weight * 2 ** ((created_at.timestamp() - now) / half_life)
+                ))
+                for recipe_id, created_at in events.items()
+            ),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        updates[field] = Greatest(F(field) - delta, Value(0.0))
+    Recipe.objects.filter(pk__in=events).update(**updates)
+    recipes_updated.send(
+        sender=Recipe, recipe_ids=list(events), fields=list(updates))
+
+
+def backdate_cart_events():
+    """
+    При добавлении поля created_at миграция проставляет всем строкам
+    списка покупок одно и то же время миграции, и все старые добавления
+    разом попали бы в trending. Настоящий возраст этих строк неизвестен,
+    поэтому сдвигаем их на период полураспада популярности назад.
+    Это самое раннее время в таблице: строки, добавленные во время
+    миграции, не трогаем.
+    """
+    stamped = ShoppingCart.objects.aggregate(
+        stamped=Min('created_at'))['stamped']
+    if stamped is None:
+        return 0
+    return ShoppingCart.objects.filter(created_at=stamped).update(
+        created_at=stamped - timedelta(
+            hours=settings.POPULARITY_HALF_LIFE_HOURS))
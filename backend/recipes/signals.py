@@ -0,0 +1,135 @@
+from django.db import transaction
+from django.db.migrations import AddField
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ingredients.models import Ingredient
+from users.models import Subscription, User
+from . import popularity, timeline
+from .batching import on_commit_batched
+from .matching import mark_changed
+from .models import (
+    Favorite, Recipe, RecipeIngredient, ShoppingCart, recipes_updated
+)
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно изменяем счётчик в строке модели, не опуская его ниже нуля."""
+    change_counters(model, [pk], field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    """Изменяем счётчик сразу в нескольких строках одним запросом."""
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+    if model is Recipe:
+        recipes_updated.send(sender=Recipe, recipe_ids=pks, fields=[field])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+        transaction.on_commit(
+            lambda: timeline.fan_out(instance.pk, instance.author_id))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+    mark_changed(instance.pk)
+
+
+def update_search_vector(**lookups):
+    """Пересчитываем поисковый вектор после фиксации транзакции, когда
+    ингредиенты рецепта уже записаны."""
+    transaction.on_commit(
+        lambda: Recipe.objects.filter(**lookups).update_search_vector())
+
+
+def update_search_vectors(recipe_ids):
+    Recipe.objects.filter(pk__in=recipe_ids).update_search_vector()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    # Один пересчёт на рецепт за транзакцию, сколько бы строк
+    # ингредиентов в ней ни изменилось.
+    on_commit_batched(update_search_vectors, instance.pk)
+    mark_changed(instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, origin=None, **kwargs):
+    if not isinstance(origin, Recipe):
+        on_commit_batched(update_search_vectors, instance.recipe_id)
+        mark_changed(instance.recipe_id)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    if not created:
+        update_search_vector(ingredients=instance)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_event_created(sender, instance, created, **kwargs):
+    if created:
+        popularity.add_events(sender, [instance.recipe_id])
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_event_deleted(sender, instance, origin=None, **kwargs):
+    if not isinstance(origin, Recipe):
+        popularity.remove_events(
+            sender, {instance.recipe_id: instance.created_at})
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            User, instance.subscribed_user_id, 'subscribers_count', 1)
+        transaction.on_commit(lambda: timeline.backfill(
+            instance.user_id, instance.subscribed_user_id))
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    change_counter(
+        User, instance.subscribed_user_id, 'subscribers_count', -1)
+    transaction.on_commit(lambda: timeline.prune(
+        instance.user_id, instance.subscribed_user_id))
+    if timeline.fan_out_resumed(instance.subscribed_user_id):
+        transaction.on_commit(lambda: timeline.backfill_followers(
+            instance.subscribed_user_id))
+
+
+def recipes_migrated(sender, plan=None, **kwargs):
+    """Миграция добавила время добавления в список покупок."""
+    if any(
+        isinstance(operation, AddField)
+        and operation.model_name_lower == 'shoppingcart'
+        and operation.name_lower == 'created_at'
+        for migration, backwards in plan or ()
+        if not backwards
+        for operation in migration.operations
+    ):
+        popularity.backdate_cart_events()
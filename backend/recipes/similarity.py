@@ -0,0 +1,131 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from scipy import sparse
+
+from .models import Recipe, RecipeIngredient, SimilarRecipe
+
+# Сколько кандидатов с наибольшим сходством по редким признакам оцениваем
+# точно в расчёте на одного соседа.
+CANDIDATES_PER_NEIGHBOR = 20
+
+# Признаки, встречающиеся не больше чем в стольких рецептах, участвуют
+# в поиске кандидатов при любой доле: на небольшом каталоге кандидатов
+# ищем по всем признакам.
+MIN_POSTING_LIMIT = 1000
+
+
+def load_features():
+    """
+    Признаки рецептов: пары массивов (id рецептов, признаки), где признак —
+    ID ингредиента или ID тега со знаком минус, чтобы они не пересекались.
+    """
+    recipe_ids = []
+    features = []
+    rows = RecipeIngredient.objects.order_by().values_list(
+        'recipe_id', 'ingredient_id')
+    for recipe_id, ingredient_id in rows.iterator(chunk_size=10000):
+        recipe_ids.append(recipe_id)
+        features.append(ingredient_id)
+    rows = Recipe.tags.through.objects.order_by().values_list(
+        'recipe_id', 'tag_id')
+    for recipe_id, tag_id in rows.iterator(chunk_size=10000):
+        recipe_ids.append(recipe_id)
+        features.append(-tag_id)
+    return np.array(recipe_ids, dtype=np.int64), np.array(
+        features, dtype=np.int64)
+
+
+def last_run():
+    """Время последнего расчёта похожих рецептов или None."""
+    return SimilarRecipe.objects.aggregate(
+        last_run=Max('computed_at'))['last_run']
+
+
+class SimilarityIndex:
+    """
+    Косинусное сходство рецептов по разреженным векторам признаков
+    с весами TF-IDF: редкий ингредиент говорит о сходстве больше,
+    чем соль, а теги весят SIMILAR_RECIPES_TAG_WEIGHT от ингредиента.
+    Векторы хранятся строками разреженной матрицы scipy, нормированными
+    по длине, и сходство пачки рецептов со всеми остальными — это одно
+    матричное произведение. В произведение на большом каталоге
+    не попадают признаки, встречающиеся больше чем в доле
+    SIMILAR_RECIPES_MAX_DF рецептов: они почти не влияют на сходство,
+    но сделали бы результат плотным. Их вклад досчитывается только
+    для лучших кандидатов.
+    """
+
+    def __init__(self, recipe_ids, features):
+        self.recipe_ids, rows = np.unique(recipe_ids, return_inverse=True)
+        feature_ids, columns = np.unique(features, return_inverse=True)
+        total = len(self.recipe_ids)
+        counts = np.bincount(columns, minlength=len(feature_ids))
+        weights = np.log((1 + total) / (1 + counts)) + 1
+        weights[feature_ids < 0] *= settings.SIMILAR_RECIPES_TAG_WEIGHT
+        matrix = sparse.csr_matrix(
+            (weights[columns], (rows, columns)),
+            shape=(total, len(feature_ids)),
+        )
+        matrix.sum_duplicates()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)))
+        matrix = sparse.csr_matrix(matrix.multiply(1 / norms))
+        max_count = max(
+            MIN_POSTING_LIMIT, int(total * settings.SIMILAR_RECIPES_MAX_DF))
+        common = counts > max_count
+        self.rare = matrix[:, np.flatnonzero(~common)].tocsr()
+        self.rare_t = self.rare.T.tocsr()
+        self.common = matrix[:, np.flatnonzero(common)].toarray()
+
+    def neighbors(self, recipe_ids, count):
+        """
+        Возвращаем для каждого рецепта до count пар (сходство, id рецепта),
+        лучшие первыми. У рецептов без признаков соседей нет.
+        """
+        results = {recipe_id: [] for recipe_id in recipe_ids}
+        if not len(self.recipe_ids):
+            return results
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        positions = np.minimum(
+            np.searchsorted(self.recipe_ids, recipe_ids),
+            len(self.recipe_ids) - 1,
+        )
+        positions = positions[self.recipe_ids[positions] == recipe_ids]
+        scores = (self.rare[positions] @ self.rare_t).tocsr()
+        limit = count * CANDIDATES_PER_NEIGHBOR
+        for row, position in enumerate(positions):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            candidates = scores.indices[start:end]
+            values = scores.data[start:end]
+            own = candidates != position
+            candidates, values = candidates[own], values[own]
+            if len(candidates) > limit:
+                best = np.argpartition(values, len(values) - limit)[-limit:]
+                candidates, values = candidates[best], values[best]
+            values = values + self.common[candidates] @ self.common[position]
+            best = np.argsort(values)[::-1][:count]
+            results[int(self.recipe_ids[position])] = list(zip(
+                values[best].tolist(),
+                self.recipe_ids[candidates[best]].tolist(),
+            ))
+        return results
+
+
+def save_neighbors(neighbors, computed_at):
+    """Заменяем соседей рецептов рассчитанными."""
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=neighbors).delete()
+        SimilarRecipe.objects.bulk_create(
+            [
+                SimilarRecipe(
+                    recipe_id=recipe_id,
+                    similar_id=similar_id,
+                    score=score,
+                    computed_at=computed_at,
+                )
+                for recipe_id, items in neighbors.items()
+                for score, similar_id in items
+            ],
+            batch_size=1000,
+        )
@@ -0,0 +1,169 @@
+import random
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from ingredients.models import Ingredient
+from tags.models import Tag
+from users.models import Subscription, User
+from .models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+
+# Префикс логина синтетических пользователей.
+USERNAME_PREFIX = 'synthetic_'
+
+BATCH_SIZE = 5000
+
+
+def batched(iterable, size=BATCH_SIZE):
+    """Разбиваем итерируемый объект на списки длины size."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def bulk_insert(model, objects, keep=False):
+    """
+    Вставляем объекты пачками, не собирая их все в памяти.
+    Созданные объекты возвращаем, только если нужен keep.
+    """
+    created = []
+    for batch in batched(objects):
+        batch = model.objects.bulk_create(batch)
+        if keep:
+            created.extend(batch)
+    return created
+
+
+def skewed_sample(rng, population, weights, count):
+    """Выбираем count разных элементов с учётом весов."""
+    count = min(count, len(population))
+    chosen = set()
+    while len(chosen) < count:
+        chosen.update(rng.choices(population, weights, k=count - len(chosen)))
+    return chosen
+
+
+@transaction.atomic
+def generate_dataset(
+    users=1000,
+    recipes=10000,
+    ingredients_per_recipe=8,
+    favorites_per_user=20,
+    carts_per_user=5,
+    subscriptions_per_user=10,
+    seed=0,
+):
+    """
+    Заполняем БД синтетическими пользователями, рецептами, избранным,
+    списками покупок и подписками. Популярность тегов, ингредиентов,
+    авторов и рецептов распределена по закону Ципфа, как в реальных данных.
+    """
+    rng = random.Random(seed)
+    tags = list(Tag.objects.values_list('id', flat=True))
+    if not tags:
+        tags = [tag.id for tag in Tag.objects.bulk_create(
+            Tag(name=f'tag{i}', slug=f'tag{i}') for i in range(8))]
+    ingredients = list(Ingredient.objects.values_list('id', flat=True))
+    if not ingredients:
+        ingredients = [item.id for item in Ingredient.objects.bulk_create(
+            Ingredient(name=f'ingredient{i}', measurement_unit='г')
+            for i in range(500))]
+
+    start = User.objects.filter(
+        username__startswith=USERNAME_PREFIX).count()
+    password = make_password(None)
+    bulk_insert(User, (
+        User(
+            username=f'{USERNAME_PREFIX}{i}',
+            email=f'{USERNAME_PREFIX}{i}@example.com',
+            first_name='Synthetic',
+            last_name=str(i),
+            password=password,
+        )
+        for i in range(start, start + users)
+    ))
+    user_ids = list(User.objects.filter(
+        username__startswith=USERNAME_PREFIX).values_list('id', flat=True))
+    if not user_ids:
+        return
+
+    def zipf(population):
+        return [1 / rank for rank in range(1, len(population) + 1)]
+
+    author_weights = zipf(user_ids)
+    recipe_ids = [recipe.id for recipe in bulk_insert(Recipe, (
+        Recipe(
+            name=f'Рецепт {i}',
+            author_id=rng.choices(user_ids, author_weights)[0],
+            image='recipes/synthetic.png',
+            text='Синтетический рецепт для нагрузочного тестирования.',
+            cooking_time=rng.randint(5, 180),
+        )
+        for i in range(recipes)
+    ), keep=True)]
+
+    tag_weights = zipf(tags)
+    bulk_insert(Recipe.tags.through, (
+        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in skewed_sample(rng, tags, tag_weights, rng.randint(1, 3))
+    ))
+    ingredient_weights = zipf(ingredients)
+    bulk_insert(RecipeIngredient, (
+        RecipeIngredient(
+            recipe_id=recipe_id,
+            ingredient_id=ingredient_id,
+            amount=rng.randint(1, 500),
+        )
+        for recipe_id in recipe_ids
+        for ingredient_id in skewed_sample(
+            rng, ingredients, ingredient_weights,
+            rng.randint(1, ingredients_per_recipe * 2 - 1))
+    ))
+
+    recipe_weights = zipf(recipe_ids)
+    now = timezone.now()
+    favorites = bulk_insert(Favorite, (
+        Favorite(user_id=user_id, recipe_id=recipe_id)
+        for user_id in user_ids
+        for recipe_id in skewed_sample(
+            rng, recipe_ids, recipe_weights, favorites_per_user)
+    ), keep=True)
+    # Растягиваем даты добавления в избранное на последние 30 дней.
+    for batch in batched(favorites):
+        for favorite in batch:
+            favorite.created_at = now - timedelta(
+                seconds=rng.randint(0, 30 * 24 * 3600))
+        Favorite.objects.bulk_update(batch, ['created_at'])
+    bulk_insert(ShoppingCart, (
+        ShoppingCart(
+            user_id=user_id,
+            recipe_id=recipe_id,
+            created_at=now - timedelta(seconds=rng.randint(0, 7 * 24 * 3600)),
+        )
+        for user_id in user_ids
+        for recipe_id in skewed_sample(
+            rng, recipe_ids, recipe_weights, carts_per_user)
+    ))
+    bulk_insert(Subscription, (
+        Subscription(user_id=user_id, subscribed_user_id=author_id)
+        for user_id in user_ids
+        for author_id in skewed_sample(
+            rng, user_ids, author_weights, subscriptions_per_user)
+        if author_id != user_id
+    ))
+    call_command('recount_counters', verbosity=0)
+    call_command('rebuild_timelines', verbosity=0)
+    call_command('update_popularity', verbosity=0)
+    call_command('build_similar_recipes', verbosity=0)
+    Recipe.objects.filter(id__in=recipe_ids).update_search_vector()
+
+
+def delete_dataset():
+    """Удаляем синтетических пользователей вместе с их данными."""
+    return User.objects.filter(
+        username__startswith=USERNAME_PREFIX).delete()
@@ -0,0 +1,33 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from recipes.management.commands.check_query_plans import Command
+from recipes.synthetic import generate_dataset
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Планы проверяем на PostgreSQL')
+class QueryPlansTest(TestCase):
+    """
+    У нагруженных запросов есть план без полного просмотра больших таблиц.
+    На маленьком наборе данных полный просмотр дешевле любого индекса,
+    поэтому запрещаем его планировщику: Seq Scan останется в плане,
+    только если подходящего индекса нет.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_dataset(users=50, recipes=300)
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def test_no_sequential_scans(self):
+        command = Command()
+        for name, queryset in command.get_queries():
+            with self.subTest(name):
+                plan = command.explain(queryset)
+                self.assertEqual(command.find_problems(plan), [], plan)
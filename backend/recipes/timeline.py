@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+
+from users.models import Subscription, User
+from .models import Recipe, TimelineEntry
+
+
+def is_fan_out_author(author_id):
+    """
+    Рецепты раскладываем по лентам только у авторов с умеренным числом
+    подписчиков. Ленты подписчиков популярных авторов дополняются их
+    рецептами при чтении.
+    """
+    subscribers_count = User.objects.filter(pk=author_id).values_list(
+        'subscribers_count', flat=True).first()
+    return (
+        subscribers_count is not None
+        and subscribers_count <= settings.FEED_FANOUT_LIMIT
+    )
+
+
+def fan_out(recipe_id, author_id):
+    """Добавляем новый рецепт в ленты подписчиков автора."""
+    if not is_fan_out_author(author_id):
+        return
+    follower_ids = Subscription.objects.filter(
+        subscribed_user_id=author_id).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id, recipe_id=recipe_id, author_id=author_id)
+            for user_id in follower_ids
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляем в ленту последние рецепты автора после подписки."""
+    if not is_fan_out_author(author_id):
+        return
+    recipe_ids = Recipe.objects.filter(author_id=author_id).order_by(
+        '-id').values_list('id', flat=True)[:settings.FEED_BACKFILL_SIZE]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id, recipe_id=recipe_id, author_id=author_id)
+            for recipe_id in recipe_ids
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_resumed(author_id):
+    """
+    Вызывается после уменьшения числа подписчиков в той же транзакции:
+    строка автора заблокирована обновлением счётчика, поэтому порог
+    FEED_FANOUT_LIMIT сверху пересекает ровно одна отписка.
+    """
+    subscribers_count = User.objects.filter(pk=author_id).values_list(
+        'subscribers_count', flat=True).first()
+    return subscribers_count == settings.FEED_FANOUT_LIMIT
+
+
+def backfill_followers(author_id):
+    """
+    Дополняем ленты всех подписчиков последними рецептами автора, который
+    снова раскладывает рецепты по лентам: опубликованные, пока у него было
+    больше FEED_FANOUT_LIMIT подписчиков, в ленты не попадали.
+    """
+    if not is_fan_out_author(author_id):
+        return
+    follower_ids = list(Subscription.objects.filter(
+        subscribed_user_id=author_id).values_list('user_id', flat=True))
+    recipe_ids = list(Recipe.objects.filter(author_id=author_id).order_by(
+        '-id').values_list('id', flat=True)[:settings.FEED_BACKFILL_SIZE])
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id, recipe_id=recipe_id, author_id=author_id)
+            for user_id in follower_ids
+            for recipe_id in recipe_ids
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def prune(user_id, author_id):
+    """Убираем рецепты автора из ленты после отписки."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def feed(user):
+    """
+    Рецепты ленты подписок пользователя. Обычно это соединение с его
+    записями ленты, а рецепты популярных авторов, которые не раскладываются
+    по лентам, добавляются отдельным условием.
+    """
+    popular_ids = list(User.objects.filter(
+        subscribers__user=user,
+        subscribers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).values_list('id', flat=True))
+    if not popular_ids:
+        return Recipe.objects.filter(timeline_entries__user=user)
+    return Recipe.objects.filter(
+        Q(Exists(TimelineEntry.objects.filter(
+            user=user, recipe=OuterRef('pk'))))
+        | Q(author_id__in=popular_ids)
+    )
@@ -1,26 +1,38 @@
+import csv
+from pathlib import Path
+
 from django.core.management.base import BaseCommand
 from tags.models import Tag
 from backend.settings import BASE_DIR
-from django.db.utils import IntegrityError
+from api.catalog import tag_catalog
 
 
 class Command(BaseCommand):
     help = "Fills the table with the data from csv file"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            type=Path,
+            default=BASE_DIR / 'data/tags.csv',
+            help='Path to a .csv file with one tag name per line',
+        )
+
     def handle(self, *args, **options):
-        with open(BASE_DIR / 'data/tags.csv', 'r') as csv_file:
-            lines = csv_file.readlines()
-            for line in lines:
-                data = line.split(',')
-                try:
-                    ingr = Tag.objects.create(
-                        name=data[0].strip(), slug=data[0].strip())
-                    ingr.save()
-                except IntegrityError:
-                    continue
-                except Exception as e:
-                    raise e
+        with open(options['path'], 'r', encoding='utf-8',
+                  newline='') as csv_file:
+            names = list(dict.fromkeys(
+                row[0].strip() for row in csv.reader(csv_file)
+                if row and row[0].strip()
+            ))
+        existing = set(Tag.objects.filter(
+            name__in=names).values_list('name', flat=True))
+        new = [Tag(name=name, slug=name) for name in names
+               if name not in existing]
+        Tag.objects.bulk_create(new, ignore_conflicts=True)
+        if new:
+            tag_catalog.invalidate()
 
-                self.stdout.write(
-                    self.style.SUCCESS('Successfully wrote "%s"' % (data[0]))
-                )
+        self.stdout.write(self.style.SUCCESS(
+            'Inserted %d tags, skipped %d existing' % (
+                len(new), len(existing))))
@@ -11,7 +11,9 @@ class MyUserAdmin(admin.ModelAdmin):
         'first_name',
         'last_name',
         'is_staff',
-        'is_active', 'avatar'
+        'is_active', 'avatar',
+        'recipes_count',
+        'subscribers_count',
     )
     search_fields = ('username', 'email', 'first_name', 'last_name')
     list_filter = ('is_staff', 'is_active')
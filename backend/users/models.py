@@ -1,6 +1,14 @@
+from io import BytesIO
+from pathlib import Path
+
 from django.contrib.auth.models import AbstractUser
+from django.core.files.base import ContentFile
 from django.core.validators import RegexValidator
 from django.db import models
+from PIL import Image
+
+# Максимальный размер миниатюры аватара, отдаваемой в API.
+AVATAR_THUMBNAIL_SIZE = (128, 128)
 
 
 class User(AbstractUser):
@@ -23,6 +31,17 @@ class User(AbstractUser):
         blank=True,
         null=True
     )
+    avatar_thumbnail = models.ImageField(
+        'Миниатюра аватара',
+        upload_to='avatars/thumbnails/',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False)
+    subscribers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -35,6 +54,23 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    def make_avatar_thumbnail(self):
+        """Создаём уменьшенную копию аватара для выдачи в API."""
+        with self.avatar.open('rb'), Image.open(self.avatar) as image:
+            image.thumbnail(AVATAR_THUMBNAIL_SIZE)
+            buffer = BytesIO()
+            image.convert('RGB').save(buffer, 'JPEG', quality=85)
+        self.avatar_thumbnail.save(
+            f'{Path(self.avatar.name).stem}.jpg',
+            ContentFile(buffer.getvalue()),
+            save=False,
+        )
+
+    def delete_avatar(self):
+        """Удаляем аватар вместе с миниатюрой."""
+        self.avatar.delete(save=False)
+        self.avatar_thumbnail.delete(save=False)
+
 
 class Subscription(models.Model):
     """Модель для хранения подписок пользователей."""